@@ -0,0 +1,119 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from emg_fd.src.utils.emg_processing_utils import process_emg, extract_reps, resample_to_rate, median_frequency, \
+    MDF_METHODS
+from emg_fd.src.utils.eval_utils import evaluate_predictions
+from emg_fd.src.utils.ml_utils import TrainConfig, make_xy_groups, build_model, select_variant_features, \
+    train_oof_predict_proba, select_threshold_max_bacc
+from emg_fd.src.utils.rep_table_utils import RepTable, ALL_FEATURES, compute_rep_table, feature_closure
+
+# mdf and every feature derived from it; these are recomputed per estimator mode
+MDF_DERIVED = [name for name in ALL_FEATURES if "mdf" in feature_closure([name])]
+
+
+def _labelled_rep_tables(data, distance_seconds, prominence, env_fs, canonical_fs):
+    """Filter and segment each labelled session once: (table with Welch features, rep segments, fs, label)."""
+    sessions = []
+    for item in data:
+        if item["signal_data"] is None:
+            continue
+        quality = item.get("quality")
+        if quality is not None and not quality["passed"]:
+            continue
+        signal_data, fs = resample_to_rate(item["signal_data"], item["fs"], canonical_fs)
+        time_axis = np.arange(len(signal_data)) / fs
+        processed = process_emg(time_axis, signal_data, fs=fs, env_fs=env_fs)
+        _, rep_windows = extract_reps(processed, distance_seconds=distance_seconds, prominence=prominence)
+        if len(rep_windows) == 0:
+            continue
+        table = compute_rep_table(rep_windows, processed, time_axis, file_id=item["id"])
+        segments = [processed["notch"][s:e] for s, e, _ in rep_windows]
+        sessions.append((table, segments, fs, item["label"]))
+    return sessions
+
+
+def _oof_balanced_accuracy(tables, labels, cfg):
+    frames = []
+    for table, label in zip(tables, labels):
+        df = table.to_frame()
+        df["is_fatigued"] = (df["rep"] >= label).astype(int)
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True).replace([np.inf, -np.inf], np.nan).dropna()
+
+    X, y, groups = make_xy_groups(df)
+    X = select_variant_features(X, cfg.model_variant)
+    oof_proba = train_oof_predict_proba(X, y, groups, build_model(cfg.model_variant), cfg)
+    best_t, _ = select_threshold_max_bacc(y, oof_proba, cfg.threshold_grid)
+    return evaluate_predictions(y, oof_proba, best_t)["balanced_accuracy"]
+
+
+def validate_mdf_methods(
+    data,
+    cfg: TrainConfig | None = None,
+    methods=None,
+    distance_seconds: float = 2.0,
+    prominence: float = 0.2,
+    env_fs: float | None = None,
+    canonical_fs: float | None = None,
+) -> pd.DataFrame:
+    """Precision/throughput trade-off of the MDF estimator modes on labelled sessions.
+
+    Sessions (records as from load_with_csv) are filtered and segmented once, as in
+    create_master_df. For each mode, per-rep MDF is timed and compared with the
+    Welch reference, then MDF and its derived features are recomputed and the
+    GroupKFold OOF balanced accuracy of cfg.model_variant is measured.
+
+    Returns:
+        one row per mode: us_per_rep, speedup, absolute error (mae/p95/max, Hz),
+        bias_hz, corr with Welch, mdf_rel_base_mae, balanced_accuracy and
+        delta_balanced_accuracy (vs. Welch).
+    """
+    cfg = cfg or TrainConfig()
+    methods = list(MDF_METHODS) if methods is None else list(methods)
+    if "welch" not in methods:
+        methods = ["welch"] + methods
+
+    sessions = _labelled_rep_tables(data, distance_seconds, prominence, env_fs, canonical_fs)
+    if not sessions:
+        raise ValueError("No labelled session with detected reps to validate on")
+    labels = [label for *_, label in sessions]
+    ref_mdf = np.concatenate([table["mdf"] for table, *_ in sessions])
+    ref_rel = np.concatenate([table["mdf_rel_base"] for table, *_ in sessions])
+
+    rows = []
+    for method in methods:
+        t0 = time.perf_counter()
+        mdf = [np.array([median_frequency(seg, fs, method=method) for seg in segments], dtype=float)
+               for _, segments, fs, _ in sessions]
+        elapsed = time.perf_counter() - t0
+
+        tables = []
+        for (base, *_), values in zip(sessions, mdf):
+            table = RepTable({k: v for k, v in base.cols.items() if k not in MDF_DERIVED},
+                             file_id=base.file_id, n=len(base))
+            table["mdf"] = values
+            tables.append(table.compute())
+
+        est = np.concatenate(mdf)
+        rel = np.concatenate([t["mdf_rel_base"] for t in tables])
+        err = est - ref_mdf
+        rows.append({
+            "method": method,
+            "us_per_rep": elapsed / len(est) * 1e6,
+            "mae_hz": float(np.mean(np.abs(err))),
+            "p95_abs_err_hz": float(np.percentile(np.abs(err), 95)),
+            "max_abs_err_hz": float(np.max(np.abs(err))),
+            "bias_hz": float(np.mean(err)),
+            "corr": float(np.corrcoef(est, ref_mdf)[0, 1]) if len(est) > 1 else np.nan,
+            "mdf_rel_base_mae": float(np.mean(np.abs(rel - ref_rel))),
+            "balanced_accuracy": _oof_balanced_accuracy(tables, labels, cfg),
+        })
+
+    out = pd.DataFrame(rows)
+    ref = out.loc[out["method"] == "welch"].iloc[0]
+    out["speedup"] = ref["us_per_rep"] / out["us_per_rep"]
+    out["delta_balanced_accuracy"] = out["balanced_accuracy"] - ref["balanced_accuracy"]
+    return out
@@ -0,0 +1,100 @@
+import io
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from emg_fd.src.utils.eval_utils import evaluate_predictions
+from emg_fd.src.utils.ml_utils import TrainConfig, MODEL_VARIANTS, make_xy_groups, build_model, \
+    select_variant_features, train_oof_predict_proba, select_threshold_max_bacc
+from emg_fd.src.utils.rep_table_utils import predict_proba_matrix
+
+
+def _time_call(fn, repeats: int) -> float:
+    """Median wall time of fn() in seconds."""
+    fn()  # warm-up
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def benchmark_model_variants(
+    df: pd.DataFrame,
+    cfg: TrainConfig,
+    variants=None,
+    label_col: str = "is_fatigued",
+    group_col: str = "file_id",
+    repeats: int = 50,
+) -> pd.DataFrame:
+    """Accuracy-vs-cost table for the registered model variants.
+
+    For each variant: OOF metrics from the GroupKFold flow (threshold chosen on
+    the OOF probabilities, as in run_training_eval), plus scoring latency
+    (predict_proba_matrix, as on the inference path) for a single rep and for a
+    median-sized session, serialized model size and
+    load time of a model fitted on all data.
+    """
+    if variants is None:
+        variants = list(MODEL_VARIANTS)
+
+    X_all, y, groups = make_xy_groups(df, label_col=label_col, group_col=group_col)
+    session_len = int(pd.Series(groups).value_counts().median())
+
+    rows = []
+    for name in variants:
+        X = select_variant_features(X_all, name)
+
+        oof_proba = train_oof_predict_proba(X, y, groups, build_model(name), cfg)
+        best_t, _ = select_threshold_max_bacc(y, oof_proba, cfg.threshold_grid)
+        metrics = evaluate_predictions(y, oof_proba, best_t)
+
+        model = build_model(name)
+        t0 = time.perf_counter()
+        model.fit(X, y)
+        fit_s = time.perf_counter() - t0
+
+        # timed as deployed: inference and the live server score a NumPy matrix with predict_proba_matrix
+        cols = list(X.columns)
+        one_rep = X.iloc[:1].to_numpy(dtype=float)
+        one_session = X.iloc[:session_len].to_numpy(dtype=float)
+        per_rep_s = _time_call(lambda: predict_proba_matrix(model, one_rep, cols), repeats)
+        per_session_s = _time_call(lambda: predict_proba_matrix(model, one_session, cols), repeats)
+
+        buf = io.BytesIO()
+        joblib.dump(model, buf)
+        payload = buf.getvalue()
+        load_s = _time_call(lambda: joblib.load(io.BytesIO(payload)), max(1, repeats // 5))
+
+        rows.append({
+            "variant": name,
+            "n_features": X.shape[1],
+            "threshold": best_t,
+            "balanced_accuracy": metrics["balanced_accuracy"],
+            "roc_auc": metrics["roc_auc"],
+            "pr_auc": metrics["pr_auc"],
+            "fit_ms": fit_s * 1e3,
+            "per_rep_latency_us": per_rep_s * 1e6,
+            "per_session_latency_us": per_session_s * 1e6,
+            "session_reps": session_len,
+            "model_kb": len(payload) / 1024,
+            "load_ms": load_s * 1e3,
+        })
+
+    return pd.DataFrame(rows)
+
+
+def pick_variant(table: pd.DataFrame, max_per_session_latency_us: float | None = None,
+                 max_model_kb: float | None = None, metric: str = "balanced_accuracy") -> str | None:
+    """Best variant by `metric` among those meeting the latency/size budget (None if none does)."""
+    ok = table
+    if max_per_session_latency_us is not None:
+        ok = ok[ok["per_session_latency_us"] <= max_per_session_latency_us]
+    if max_model_kb is not None:
+        ok = ok[ok["model_kb"] <= max_model_kb]
+    if len(ok) == 0:
+        return None
+    return str(ok.sort_values(metric, ascending=False).iloc[0]["variant"])
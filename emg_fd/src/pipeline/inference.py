@@ -5,7 +5,10 @@ from emg_fd.src.utils.data_utils import (
     predict_fatigue_on_emg,
     load_model_bundle,
     load_and_extract_emg_from_c3d,
+    iter_c3d_folder,
 )
+from emg_fd.src.utils.cache_utils import ResultCache, file_fingerprint, make_key
+from emg_fd.src.utils.drift_utils import DriftMonitor
 
 def _get_model_path(model_path: str | Path | None):
     if model_path:
@@ -16,16 +19,26 @@ def _get_model_path(model_path: str | Path | None):
     return resources.files("emg_fd").joinpath("models/fatigue_model_bundle.joblib")
 
 
-def inference_for_single_test_file(file_path, channel_label, model_path: str | Path | None = None):
+def _load_bundle(model_path: str | Path | None):
     model_ref = _get_model_path(model_path)
 
     if not isinstance(model_ref, Path):
         with resources.as_file(model_ref) as real_path:
-            bundle = load_model_bundle(str(real_path))
-    else:
-        bundle = load_model_bundle(str(model_ref))
+            return load_model_bundle(str(real_path))
+    return load_model_bundle(str(model_ref))
+
+
+def inference_for_single_test_file(file_path, channel_label, model_path: str | Path | None = None,
+                                   cache: ResultCache | None = None):
+    bundle = _load_bundle(model_path)
 
-    signal_data, fs, _ = load_and_extract_emg_from_c3d(file_path, channel_label)
+    if cache is not None:
+        # keyed on the file bytes so a repeat query skips the C3D parse as well
+        key = make_key(file_fingerprint(file_path), channel_label)
+        signal_data, fs, _ = cache.get_or_compute(
+            "signal", key, lambda: load_and_extract_emg_from_c3d(file_path, channel_label))
+    else:
+        signal_data, fs, _ = load_and_extract_emg_from_c3d(file_path, channel_label)
 
     df_pred, trigger_rep = predict_fatigue_on_emg(
         signal_data=signal_data,
@@ -34,6 +47,39 @@ def inference_for_single_test_file(file_path, channel_label, model_path: str | P
         file_id="test_file",
         distance_seconds=2.0,
         prominence=0.2,
+        cache=cache,
     )
 
-    return df_pred, trigger_rep
\ No newline at end of file
+    return df_pred, trigger_rep
+
+
+def inference_for_folder(folder_path, channel_label, model_path: str | Path | None = None,
+                         prefetch: int = 2, max_buffer_bytes: int | None = None,
+                         drift_monitor: DriftMonitor | None = None):
+    """Run inference on every .c3d file in a folder, loading the next files while the current one is scored.
+
+    A drift_monitor (DriftMonitor.from_bundle on the same bundle) is updated with every scored file;
+    its periodic reports collect in drift_monitor.reports.
+
+    Returns:
+        dict mapping file id -> (df_pred, trigger_rep); files that fail to load map to (None, None).
+    """
+    bundle = _load_bundle(model_path)
+
+    results = {}
+    for record in iter_c3d_folder(folder_path, channel_label, prefetch=prefetch, max_buffer_bytes=max_buffer_bytes):
+        if record["signal_data"] is None:
+            results[record["id"]] = (None, None)
+            continue
+
+        results[record["id"]] = predict_fatigue_on_emg(
+            signal_data=record["signal_data"],
+            fs=record["fs"],
+            model_bundle=bundle,
+            file_id=record["id"],
+            distance_seconds=2.0,
+            prominence=0.2,
+            drift_monitor=drift_monitor,
+        )
+
+    return results
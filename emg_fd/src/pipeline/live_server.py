@@ -0,0 +1,331 @@
+import asyncio
+import base64
+import json
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from emg_fd.src.utils.drift_utils import DriftMonitor
+from emg_fd.src.utils.rep_table_utils import feature_closure, predict_proba_matrix
+from emg_fd.src.utils.stream_utils import StreamingFatigueDetector
+
+# Wire format: one JSON object per line over a local TCP socket.
+#   client -> server: {"type": "open", "session": id, "fs": 2000.0}
+#                     {"type": "samples", "b64": <little-endian float32>}  (or "data": [floats])
+#                     {"type": "close"}
+#   server -> client: {"event": "opened" | "rep" | "trigger" | "closed", ...}
+
+
+def encode_samples(chunk: np.ndarray) -> dict:
+    return {"type": "samples", "b64": base64.b64encode(np.asarray(chunk, dtype="<f4").tobytes()).decode("ascii")}
+
+
+def _decode_samples(msg: dict) -> np.ndarray:
+    if "b64" in msg:
+        return np.frombuffer(base64.b64decode(msg["b64"]), dtype="<f4").astype(float)
+    return np.asarray(msg.get("data", []), dtype=float)
+
+
+class _Session:
+    __slots__ = ("id", "detector", "chunks", "outbox", "unscored", "dropped_events", "worker", "sender", "error")
+
+    def __init__(self, session_id, detector, max_pending_chunks):
+        self.id = session_id
+        self.detector = detector
+        self.chunks = asyncio.Queue(maxsize=max_pending_chunks)
+        self.outbox = asyncio.Queue()
+        self.unscored = 0
+        self.dropped_events = 0
+        self.worker = None
+        self.sender = None
+        self.error = None
+
+
+class LiveMonitorServer:
+    """asyncio server monitoring many concurrent EMG streams with one shared model bundle.
+
+    Every connection carries one session with its own StreamingFatigueDetector
+    (incremental filter and rep state). Finalised reps from all sessions are
+    scored together every tick_seconds with a single predict_proba call.
+
+    Backpressure: each session buffers at most max_pending_chunks chunks; beyond
+    that the server stops reading the socket, so a client sending faster than it
+    can be processed is throttled by TCP. Rep events for a client that does not
+    read its socket are dropped beyond max_pending_events; triggers never are.
+
+    With a drift_monitor, every closed session is added to it; its periodic
+    reports are available as drift_reports (the monitor's `reports`).
+    """
+
+    def __init__(self, model_bundle: dict, tick_seconds: float = 0.05, max_pending_chunks: int = 32,
+                 max_pending_events: int = 256, detector_kwargs: dict | None = None,
+                 drift_monitor: DriftMonitor | None = None):
+        self.model_bundle = model_bundle
+        self.feature_cols = list(model_bundle["feature_cols"])
+        feature_closure(self.feature_cols)
+        self.tick_seconds = tick_seconds
+        self.max_pending_chunks = max_pending_chunks
+        self.max_pending_events = max_pending_events
+        self.detector_kwargs = detector_kwargs or {}
+        self.drift_monitor = drift_monitor
+
+        self.sessions = {}
+        self._dirty = {}
+        self._server = None
+        self._ticker = None
+        self.tick_stats = deque(maxlen=10000)  # (n_sessions, n_reps, ms) per scoring batch
+
+    @property
+    def drift_reports(self):
+        return self.drift_monitor.reports if self.drift_monitor is not None else deque()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self._ticker = asyncio.create_task(self._tick_loop())
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        session = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):  # reset by the client / line over the stream limit
+                    break
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    kind = msg.get("type")
+                    if kind == "open" and session is None:
+                        session = self._open(msg, writer)
+                    elif kind == "samples" and session is not None:
+                        await session.chunks.put(_decode_samples(msg))  # waits when the session is behind
+                    elif kind == "close":
+                        break
+                except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                    # malformed message or bad open request: report it and drop the connection
+                    error = {"event": "error", "reason": f"{type(exc).__name__}: {exc}"}
+                    if session is not None:
+                        self._emit(session, error)
+                    else:
+                        writer.write((json.dumps(error) + "\n").encode())
+                    break
+        finally:
+            try:
+                if session is not None:
+                    await self._close_session(session)
+            finally:
+                if session is not None and self.sessions.get(session.id) is session:
+                    del self.sessions[session.id]
+                writer.close()
+
+    def _open(self, msg, writer):
+        session_id = str(msg.get("session", f"session-{len(self.sessions) + 1}"))
+        if session_id in self.sessions:
+            raise ValueError(f"session '{session_id}' is already open")
+        fs = float(msg["fs"])
+        if not np.isfinite(fs) or fs <= 0:
+            raise ValueError(f"fs must be a positive finite sampling rate, got {msg['fs']!r}")
+        detector = StreamingFatigueDetector(self.model_bundle, fs, file_id=session_id, **self.detector_kwargs)
+        session = _Session(session_id, detector, self.max_pending_chunks)
+        session.worker = asyncio.create_task(self._consume(session))
+        session.sender = asyncio.create_task(self._send(session, writer))
+        self.sessions[session_id] = session
+        self._emit(session, {"event": "opened", "file_id": session_id})
+        return session
+
+    async def _close_session(self, session):
+        """Drain and finish the session's detector, send the closing events and stop its sender."""
+        await session.chunks.put(None)  # _consume keeps draining even after a failure, so this never blocks
+        await session.worker
+        if session.error is None and self.drift_monitor is not None and session.detector.table is not None:
+            self.drift_monitor.update(session.detector.table)
+        self._emit(session, {"event": "closed", "file_id": session.id, "reps": session.detector.n_reps,
+                             "trigger_rep": session.detector.trigger_rep,
+                             "dropped_events": session.dropped_events, "error": session.error})
+        session.outbox.put_nowait(None)
+        await session.sender
+
+    async def _consume(self, session):
+        while True:
+            chunk = await session.chunks.get()
+            if chunk is None:
+                break
+            if session.error is not None:
+                continue  # keep the queue moving so the reader is never blocked
+            try:
+                n_new = session.detector.push_samples(chunk)
+            except Exception as exc:
+                self._fail(session, exc)
+                continue
+            if n_new:
+                session.unscored += n_new
+                self._dirty[session.id] = session
+        self._dirty.pop(session.id, None)
+        if session.error is not None:
+            return
+        try:
+            session.unscored += session.detector.flush()
+            if session.unscored:
+                self._score([session])
+        except Exception as exc:
+            self._fail(session, exc)
+
+    def _fail(self, session, exc):
+        session.error = f"{type(exc).__name__}: {exc}"
+        self._dirty.pop(session.id, None)
+        self._emit(session, {"event": "error", "file_id": session.id, "reason": session.error})
+
+    async def _send(self, session, writer):
+        while True:
+            event = await session.outbox.get()
+            if event is None:
+                break
+            try:
+                writer.write((json.dumps(event) + "\n").encode())
+                await writer.drain()
+            except ConnectionError:
+                break  # client went away; the reader side ends the session
+
+    def _emit(self, session, event):
+        if event["event"] == "rep" and session.outbox.qsize() >= self.max_pending_events:
+            session.dropped_events += 1
+            return
+        session.outbox.put_nowait(event)
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            if self._dirty:
+                sessions = list(self._dirty.values())
+                self._dirty.clear()
+                try:
+                    self._score(sessions)
+                except Exception:
+                    # isolate the failing session(s) instead of stopping scoring for everyone
+                    for session in sessions:
+                        try:
+                            self._score([session])
+                        except Exception as exc:
+                            self._fail(session, exc)
+
+    def _score(self, sessions):
+        """One predict_proba call for the finalised reps of all given sessions."""
+        t0 = time.perf_counter()
+        tables = [s.detector.rep_table() for s in sessions]
+        X = np.vstack([t.matrix(self.feature_cols) for t in tables])
+        proba = predict_proba_matrix(self.model_bundle["model"], X, self.feature_cols)
+
+        offset = 0
+        for session, table in zip(sessions, tables):
+            p = proba[offset:offset + len(table)]
+            offset += len(table)
+            trigger = session.detector.apply_proba(table, p)
+            for r in range(len(table) - session.unscored + 1, len(table) + 1):
+                self._emit(session, {"event": "rep", "file_id": session.id, "rep": r,
+                                     "proba": float(table["proba_used"][r - 1]),
+                                     "sample": session.detector.n_samples})
+            session.unscored = 0
+            if trigger is not None:
+                self._emit(session, trigger)
+        self.tick_stats.append((len(sessions), len(X), (time.perf_counter() - t0) * 1e3))
+
+
+async def simulated_client(host: str, port: int, session_id: str, signal_data: np.ndarray, fs: float,
+                           chunk_seconds: float = 0.05, speed: float | None = 1.0):
+    """Stream one recording to the server like a live amplifier and collect its events.
+
+    Each event gets latency_ms: time from sending the chunk that completed the
+    event's sample count to receiving the event.
+    """
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(host, port)
+    sent_at = {}
+    events = []
+
+    async def receive():
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            event = json.loads(line)
+            if "sample" in event and event["sample"] in sent_at:
+                event["latency_ms"] = (loop.time() - sent_at[event["sample"]]) * 1e3
+            events.append(event)
+            if event["event"] == "closed":
+                break
+
+    receiver = asyncio.create_task(receive())
+    writer.write((json.dumps({"type": "open", "session": session_id, "fs": fs}) + "\n").encode())
+
+    chunk = max(1, int(round(chunk_seconds * fs)))
+    t0 = loop.time()
+    for start in range(0, len(signal_data), chunk):
+        end = min(len(signal_data), start + chunk)
+        if speed is not None:
+            await asyncio.sleep(max(0.0, t0 + end / fs / speed - loop.time()))
+        writer.write((json.dumps(encode_samples(signal_data[start:end])) + "\n").encode())
+        await writer.drain()
+        sent_at[end] = loop.time()
+
+    writer.write(b'{"type": "close"}\n')
+    await writer.drain()
+    await receiver
+    writer.close()
+    return events
+
+
+def run_simulation(model_bundle: dict, signals, chunk_seconds: float = 0.05, speed: float | None = 1.0,
+                   tick_seconds: float = 0.05, **server_kwargs):
+    """Run a server plus one simulated client per (signal, fs) and summarise the result.
+
+    Returns:
+        per-session table (reps, trigger rep, p50/p99 event latency) and server stats
+        (scoring batches, reps per batch, ms per batch).
+    """
+
+    async def main():
+        server = LiveMonitorServer(model_bundle, tick_seconds=tick_seconds, **server_kwargs)
+        host, port = await server.start()
+        try:
+            results = await asyncio.gather(*[
+                simulated_client(host, port, f"athlete-{i + 1}", sig, fs, chunk_seconds=chunk_seconds, speed=speed)
+                for i, (sig, fs) in enumerate(signals)
+            ])
+        finally:
+            await server.stop()
+        return results, list(server.tick_stats)
+
+    results, ticks = asyncio.run(main())
+
+    rows = []
+    for events in results:
+        closed = next(e for e in events if e["event"] == "closed")
+        lat = np.array([e["latency_ms"] for e in events if "latency_ms" in e])
+        rows.append({
+            "session": closed["file_id"],
+            "reps": closed["reps"],
+            "trigger_rep": closed["trigger_rep"],
+            "dropped_events": closed["dropped_events"],
+            "event_latency_p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+            "event_latency_p99_ms": float(np.percentile(lat, 99)) if len(lat) else None,
+        })
+
+    tick_arr = np.array(ticks) if ticks else np.zeros((0, 3))
+    stats = {
+        "scoring_batches": len(tick_arr),
+        "mean_sessions_per_batch": float(tick_arr[:, 0].mean()) if len(tick_arr) else 0.0,
+        "mean_reps_per_batch": float(tick_arr[:, 1].mean()) if len(tick_arr) else 0.0,
+        "batch_p99_ms": float(np.percentile(tick_arr[:, 2], 99)) if len(tick_arr) else 0.0,
+    }
+    return pd.DataFrame(rows), stats
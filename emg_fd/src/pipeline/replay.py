@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, sosfilt
+
+from emg_fd.src.pipeline.inference import _load_bundle
+from emg_fd.src.utils.data_utils import load_and_extract_emg_from_c3d
+from emg_fd.src.utils.emg_processing_utils import process_emg, extract_reps
+from emg_fd.src.utils.stream_utils import StreamingFatigueDetector
+
+
+def synthetic_emg_session(n_reps: int = 15, onset_rep: int = 10, fs: float = 2000.0, rep_period: float = 3.0,
+                          rest_seconds: float = 5.0, seed: int = 0):
+    """Synthetic set of curls: one EMG burst per rep on a noise floor.
+
+    From onset_rep on, burst amplitude grows and power shifts to lower frequencies
+    (RMS up, MDF down), roughly like the recordings the bundle was trained on.
+
+    Returns:
+        signal_data, fs, onset_rep
+    """
+    rng = np.random.default_rng(seed)
+    n = int((2 * rest_seconds + n_reps * rep_period) * fs)
+    t = np.arange(n) / fs
+    sig = rng.normal(0, 5, n)
+
+    sos_lo = butter(2, 80.0 / (0.5 * fs), btype="low", output="sos")
+    for i in range(n_reps):
+        centre = rest_seconds + (i + 0.5) * rep_period
+        w = np.exp(-0.5 * ((t - centre) / 0.4) ** 2)
+        fatigue = max(0, i + 1 - onset_rep + 1) / max(1, n_reps - onset_rep + 1)
+        burst = rng.normal(0, 1, n)
+        slow = sosfilt(sos_lo, rng.normal(0, 1, n)) * 3.0
+        sig += w * 200 * (1 + 0.6 * fatigue) * ((1 - fatigue) * burst + fatigue * slow)
+    return sig, fs, onset_rep
+
+
+def _chunk_bounds(n: int, chunk: int):
+    return [(s, min(n, s + chunk)) for s in range(0, n, chunk)]
+
+
+def replay_session(signal_data: np.ndarray, fs: float, model_bundle: dict, onset_rep: int | None = None,
+                   chunk_seconds: float = 0.05, speed: float | None = 1.0,
+                   distance_seconds: float = 2.0, prominence: float = 0.2, detector_kwargs: dict | None = None):
+    """Feed a recording to a StreamingFatigueDetector in timed chunks and time everything.
+
+    A producer thread releases each chunk when its last sample would have been
+    acquired (at `speed` x real time; speed=None releases as fast as possible) and
+    the consumer processes the queue. onset_rep is the labelled fatigue onset
+    (1-based); its end sample comes from the offline segmentation of the session.
+
+    Returns:
+        dict with the per-chunk timing table ("chunks"), detector events and the
+        trigger/onset bookkeeping consumed by latency_report().
+    """
+    signal_data = np.asarray(signal_data, dtype=float)
+    chunk = max(1, int(round(chunk_seconds * fs)))
+    bounds = _chunk_bounds(len(signal_data), chunk)
+    detector = StreamingFatigueDetector(model_bundle, fs, distance_seconds=distance_seconds, prominence=prominence,
+                                        **(detector_kwargs or {}))
+
+    onset_end = None
+    if onset_rep is not None:
+        time_axis = np.arange(len(signal_data)) / fs
+        _, rep_windows = extract_reps(process_emg(time_axis, signal_data, fs=fs),
+                                      distance_seconds=distance_seconds, prominence=prominence)
+        if 1 <= onset_rep <= len(rep_windows):
+            onset_end = int(rep_windows[onset_rep - 1][1])
+
+    q = queue.Queue()
+    t0 = time.perf_counter()
+
+    def produce():
+        for i, (s, e) in enumerate(bounds):
+            if speed is not None:
+                delay = t0 + e / fs / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            q.put((i, s, e, time.perf_counter()))
+        q.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    rows, events = [], []
+    trigger_wall = None
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        i, s, e, arrived = item
+        depth = q.qsize()
+        started = time.perf_counter()
+        new_events = detector.push(signal_data[s:e])
+        done = time.perf_counter()
+        rows.append({"chunk": i, "end_sample": e, "arrived_s": arrived - t0, "wait_ms": (started - arrived) * 1e3,
+                     "proc_ms": (done - started) * 1e3, "queue_depth": depth, "n_events": len(new_events)})
+        if trigger_wall is None and any(ev["event"] == "trigger" for ev in new_events):
+            trigger_wall = done
+        events.extend(new_events)
+    producer.join()
+
+    end_events = detector.finish()
+    if trigger_wall is None and any(ev["event"] == "trigger" for ev in end_events):
+        trigger_wall = time.perf_counter()
+    events.extend(end_events)
+
+    # without pacing there is no wall-clock acquisition time to compare against
+    onset_wall = None if onset_end is None or speed is None else t0 + onset_end / fs / speed
+    return {
+        "chunks": pd.DataFrame(rows),
+        "events": events,
+        "fs": fs,
+        "speed": speed,
+        "chunk_seconds": chunk / fs,
+        "duration_s": len(signal_data) / fs,
+        "n_reps": detector.n_reps,
+        "trigger_rep": detector.trigger_rep,
+        "trigger_sample": detector.trigger_sample,
+        "onset_rep": onset_rep,
+        "onset_end_sample": onset_end,
+        "trigger_wall_s": None if trigger_wall is None else trigger_wall - t0,
+        "onset_end_wall_s": None if onset_wall is None else onset_wall - t0,
+    }
+
+
+def replay_c3d(file_path: str, channel_label: str, model_path: str | Path | None = None,
+               onset_rep: int | None = None, **kwargs):
+    """replay_session on a recorded C3D session (packaged bundle unless model_path is given)."""
+    signal_data, fs, _ = load_and_extract_emg_from_c3d(file_path, channel_label)
+    if signal_data is None:
+        return None
+    return replay_session(signal_data, fs, _load_bundle(model_path), onset_rep=onset_rep, **kwargs)
+
+
+def latency_report(result: dict) -> dict:
+    """Summarise a replay: per-chunk processing percentiles, queueing and detection delay."""
+    chunks = result["chunks"]
+    proc = chunks["proc_ms"].to_numpy()
+    report = {
+        "n_chunks": len(chunks),
+        "chunk_ms": result["chunk_seconds"] * 1e3,
+        "speed": result["speed"],
+        "proc_p50_ms": float(np.percentile(proc, 50)),
+        "proc_p99_ms": float(np.percentile(proc, 99)),
+        "proc_max_ms": float(proc.max()),
+        "wait_p99_ms": float(np.percentile(chunks["wait_ms"], 99)),
+        "queue_depth_max": int(chunks["queue_depth"].max()),
+        "real_time_factor": float(proc.sum() / 1e3 / result["duration_s"]),  # <1: keeps up with the amplifier
+        "n_reps": result["n_reps"],
+        "onset_rep": result["onset_rep"],
+        "trigger_rep": result["trigger_rep"],
+        "delta_reps": None,
+        "detection_delay_s": None,
+        "detection_delay_wall_s": None,
+    }
+    if result["trigger_rep"] is not None and result["onset_rep"] is not None:
+        report["delta_reps"] = result["trigger_rep"] - result["onset_rep"]
+    if result["trigger_sample"] is not None and result["onset_end_sample"] is not None:
+        # signal time from the end of the labelled onset rep to the sample at which the trigger fired
+        report["detection_delay_s"] = (result["trigger_sample"] - result["onset_end_sample"]) / result["fs"]
+        if result["onset_end_wall_s"] is not None:
+            report["detection_delay_wall_s"] = result["trigger_wall_s"] - result["onset_end_wall_s"]
+    return report
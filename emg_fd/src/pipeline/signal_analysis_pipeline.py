@@ -1,4 +1,11 @@
-from emg_fd.src.utils.emg_processing_utils import process_emg, extract_reps, compute_rep_features, detect_optimal_rep, plot_rep_trends
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from emg_fd.src.utils.emg_processing_utils import process_emg, extract_reps, compute_rep_features, detect_optimal_rep, \
+    detect_optimal_rep_batch, plot_rep_trends, save_rep_trends
 
 
 def signal_analysis_pipeline(data):
@@ -32,4 +39,95 @@ def signal_analysis_pipeline(data):
 
             # 5. Plot the trends
             plot_rep_trends(time, processed_emg_c3d, features_c3d, optimal_rep=opt_rep_c3d,
-                            title=f'Trends for {d.get("name")}')
\ No newline at end of file
+                            title=f'Trends for {d.get("name")}')
+
+
+def _session_rep_trends(d, distance_seconds=2.1, prominence=0.35, env_fs=None):
+    """Worker: per-rep RMS/MDF for one session (None when the session has no signal)."""
+    if d["signal_data"] is None or d["fs"] is None:
+        return None
+    time = d["time"] if d.get("time") is not None else np.arange(len(d["signal_data"])) / d["fs"]
+    processed = process_emg(time, d["signal_data"], fs=d["fs"], env_fs=env_fs)
+    peaks, rep_windows = extract_reps(processed, distance_seconds=distance_seconds, prominence=prominence)
+    if len(rep_windows) == 0:
+        return {"rms": np.empty(0), "mdf": np.empty(0), "processed": processed, "features": None, "time": time}
+    features = compute_rep_features(rep_windows, processed, time)
+    return {"rms": features["rms"].to_numpy(), "mdf": features["mdf"].to_numpy(),
+            "processed": processed, "features": features, "time": time}
+
+
+def _analyze_chunk(chunk, distance_seconds, prominence, env_fs, lookback, plot_dir):
+    """Worker: rep trends for a chunk of sessions, heuristic scored once for the whole chunk."""
+    trends = [_session_rep_trends(d, distance_seconds, prominence, env_fs) for d in chunk]
+    ok = [t for t in trends if t is not None]
+    decisions = iter(detect_optimal_rep_batch([t["rms"] for t in ok], [t["mdf"] for t in ok], lookback=lookback))
+
+    rows = []
+    for d, t in zip(chunk, trends):
+        label = d.get("label")
+        if t is None:
+            rows.append({"id": d.get("id"), "name": d.get("name"), "label": label, "reps_detected": 0,
+                         "optimal_rep": None, "method": "no_signal"})
+            continue
+        idx, method = next(decisions)
+        opt_rep = None if idx is None else idx + 1
+        rows.append({"id": d.get("id"), "name": d.get("name"), "label": label, "reps_detected": len(t["rms"]),
+                     "optimal_rep": opt_rep, "method": method})
+
+        if plot_dir is not None and t["features"] is not None:
+            save_rep_trends(os.path.join(plot_dir, f"{d.get('id', d.get('name'))}_trends.png"),
+                            t["time"], t["processed"], t["features"], optimal_rep=opt_rep,
+                            ground_truth_failure_rep=label, title=f'Trends for {d.get("name")}')
+    return rows
+
+
+def batch_signal_analysis(data, n_workers: int | None = None, chunk_size: int = 16,
+                          distance_seconds: float = 2.1, prominence: float = 0.35, env_fs: float | None = None,
+                          lookback: int = 2, plot_dir: str | None = None) -> pd.DataFrame:
+    """Headless signal_analysis_pipeline over many sessions.
+
+    Sessions are processed in chunks on a process pool (n_workers=0 runs in-process);
+    plots are optional and written as PNGs by the workers into plot_dir.
+
+    Returns:
+        one row per session: id, name, label, reps_detected, optimal_rep, method and,
+        where the CSV label is available, delta_reps (optimal_rep - label).
+    """
+    data = list(data)
+    if plot_dir is not None:
+        os.makedirs(plot_dir, exist_ok=True)
+
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    args = (distance_seconds, prominence, env_fs, lookback, plot_dir)
+
+    rows = []
+    if n_workers == 0:
+        for chunk in chunks:
+            rows.extend(_analyze_chunk(chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            for chunk_rows in pool.map(_analyze_chunk, chunks, *[[a] * len(chunks) for a in args]):
+                rows.extend(chunk_rows)
+
+    out = pd.DataFrame(rows, columns=["id", "name", "label", "reps_detected", "optimal_rep", "method"])
+    label = pd.to_numeric(out["label"], errors="coerce")
+    out["delta_reps"] = pd.to_numeric(out["optimal_rep"], errors="coerce") - label
+    out["exact_match"] = out["delta_reps"] == 0
+    return out
+
+
+def summarize_heuristic_agreement(table: pd.DataFrame) -> dict:
+    """Agreement of the heuristic optimal rep with the labelled failure rep."""
+    valid = table.dropna(subset=["delta_reps"])
+    if len(valid) == 0:
+        return {"sessions_total": len(table), "sessions_scored": 0}
+    delta = valid["delta_reps"].to_numpy()
+    return {
+        "sessions_total": len(table),
+        "sessions_scored": len(valid),
+        "mean_delta_reps": float(np.mean(delta)),
+        "mae_reps": float(np.mean(np.abs(delta))),
+        "pct_within_0_reps": float(np.mean(delta == 0)),
+        "pct_within_1_rep": float(np.mean(np.abs(delta) <= 1)),
+        "pct_within_2_reps": float(np.mean(np.abs(delta) <= 2)),
+    }
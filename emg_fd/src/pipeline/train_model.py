@@ -1,8 +1,10 @@
 import pandas as pd
 
 from emg_fd.src.utils.data_utils import save_model_bundle
+from emg_fd.src.utils.drift_utils import build_reference_sketches
 from emg_fd.src.utils.eval_utils import evaluate_predictions
-from emg_fd.src.utils.ml_utils import TrainConfig, make_xy_groups, build_model, train_oof_predict_proba, select_threshold_max_bacc
+from emg_fd.src.utils.ml_utils import TrainConfig, make_xy_groups, build_model, train_oof_predict_proba, select_threshold_max_bacc, \
+    select_variant_features
 from typing import Dict
 
 from emg_fd.src.utils.plot_utils import plot_threshold_sweep, plot_confusion, plot_proba_hist, plot_roc_pr
@@ -16,7 +18,8 @@ def run_training_eval(
     plot: bool = True
 ):
     X, y, groups = make_xy_groups(df, label_col=label_col, group_col=group_col)
-    model = build_model()
+    X = select_variant_features(X, cfg.model_variant)
+    model = build_model(cfg.model_variant)
 
     oof_proba = train_oof_predict_proba(X, y, groups, model, cfg)
     best_t, sweep = select_threshold_max_bacc(y, oof_proba, cfg.threshold_grid)
@@ -35,13 +38,18 @@ def run_training_eval(
 
 def train_final_model(
     df: pd.DataFrame,
-    best_threshold: float,m,n
+    best_threshold: float,m,n,
+    variant: str = "logreg",
+    mdf_method: str = "welch"
     ):
     y = df["is_fatigued"].astype(int).to_numpy()
     X = df.drop(columns=["is_fatigued", "file_id"]).select_dtypes(include=["number"])
+    # sketches of every feature (not only the model's), so production drift can be tracked
+    drift_reference = build_reference_sketches(X)
+    X = select_variant_features(X, variant)
     feature_cols = list(X.columns)
 
-    final_model = build_model()
+    final_model = build_model(variant)
     final_model.fit(X, y)
 
     best_threshold = best_threshold
@@ -55,5 +63,8 @@ def train_final_model(
         trigger_M=trigger_m,
         trigger_N=trigger_n,
         smooth_alpha=smooth_alpha,
+        model_variant=variant,
+        mdf_method=mdf_method,
+        drift_reference=drift_reference,
         bundle_path="./models/fatigue_model_bundle.joblib"
     )
\ No newline at end of file
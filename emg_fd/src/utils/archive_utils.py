@@ -0,0 +1,323 @@
+import io
+import json
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from emg_fd.src.utils.emg_processing_utils import _segmentation_envelope, envelope_at
+from emg_fd.src.utils.rep_table_utils import RepTable, FEATURE_ORDER, feature_closure
+
+# Archive layout: one zip file, every member deflate-compressed and readable on its own.
+#   <session>/meta.json        id, label, fs, window mode and per-rep metadata (exact window start/end,
+#                              peak_idx, peak_time, env_peak, archived seg_start/seg_end, rest_energy)
+#   <session>/env.npy          envelope at reduced rate
+#   <session>/rep_0001.npy     filtered ('notch') samples of rep 1 between seg_start and seg_end
+ARCHIVE_VERSION = 2
+WINDOW_MODES = ("active", "full")
+
+
+def _npy_bytes(arr: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, arr, allow_pickle=False)
+    return buf.getvalue()
+
+
+def _active_span(env, q, start, end, peak, activity_ratio):
+    """Full-rate bounds of the contiguous envelope region around `peak` above the activity threshold.
+
+    The threshold sits activity_ratio of the way from the window's envelope floor
+    to its peak, so it follows the noise floor of each recording.
+    """
+    lo = min(start // q, len(env) - 1)
+    hi = min(max(lo + 1, -(-end // q)), len(env))
+    e = np.asarray(env[lo:hi], dtype=float)
+    pk = min(max(peak // q - lo, 0), len(e) - 1)
+    floor = e.min()
+    below = e < floor + activity_ratio * (e[pk] - floor)
+    left = np.flatnonzero(below[:pk])
+    right = np.flatnonzero(below[pk:])
+    a = lo + (left[-1] + 1 if len(left) else 0)
+    b = lo + (pk + right[0] if len(right) else len(e))
+    return a * q, b * q
+
+
+class RepArchiveWriter:
+    """Writes sessions into a rep-segment archive (see the layout above).
+
+    extract_reps windows tile the whole recording (boundaries are the midpoints
+    between peaks, the first and last rep run to the edges), so what is stored per
+    rep depends on `window`:
+
+    - "active" (default): the contiguous region around the peak where the envelope
+      is above the activity threshold, plus margin_seconds each side, clipped to the
+      rep window. Storage scales with rep time; the rest samples are dropped and
+      read back as zeros. RepArchive restores rms exactly from the stored
+      rest_energy of each rep; spectral features (mdf) and new features on the
+      signal are approximations.
+    - "full": the exact rep windows and no margin. Features are reproduced exactly,
+      but the archive holds the whole recording, rests included.
+
+    The exact window bounds are kept in the metadata in both modes.
+    """
+
+    def __init__(self, path, window: str = "active", activity_ratio: float = 0.1, margin_seconds: float = 0.25,
+                 env_fs: float = 100.0, dtype: str = "float32", mode: str = "w"):
+        if window not in WINDOW_MODES:
+            raise ValueError(f"Unknown archive window '{window}'; choose from {list(WINDOW_MODES)}")
+        self.path = str(path)
+        self.window = window
+        self.activity_ratio = activity_ratio
+        self.margin_seconds = margin_seconds if window == "active" else 0.0
+        self.env_fs = env_fs
+        self.dtype = np.dtype(dtype)
+        self._zf = zipfile.ZipFile(self.path, mode, compression=zipfile.ZIP_DEFLATED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zf.close()
+
+    def add_session(self, session_id, processed: dict, rep_windows, time=None, label=None, name=None,
+                    env_peak=None):
+        """Archive one processed session (process_emg output and its rep windows).
+
+        Peak times come from `time` (peak_idx / fs without it) and env_peak defaults
+        to envelope_at(processed, peak_idx), as in compute_rep_features.
+        """
+        sid = str(session_id)
+        fs = float(processed["fs"])
+        sig = processed["notch"]
+        n = len(sig)
+        windows = np.asarray(rep_windows, dtype=np.int64).reshape(len(rep_windows), 3)
+        margin = int(round(self.margin_seconds * fs))
+
+        env, env_rate, q = _segmentation_envelope(processed)
+        step = max(1, int(round(env_rate / self.env_fs)))  # envelope is low-passed at 5 Hz, plain slicing is safe
+        env_out = np.asarray(env[::step], dtype=self.dtype)
+
+        if env_peak is None:
+            env_peak = [envelope_at(processed, p) for p in windows[:, 2]]
+        peak_time = np.asarray(time)[windows[:, 2]] if time is not None else windows[:, 2] / fs
+
+        if self.window == "full":
+            seg_start, seg_end = windows[:, 0].copy(), windows[:, 1].copy()
+        else:
+            spans = np.array([_active_span(env, q, s, e, p, self.activity_ratio) for s, e, p in windows],
+                             dtype=np.int64).reshape(len(windows), 2)
+            # margins stay inside the rep window, so no sample is stored twice
+            seg_start = np.clip(spans[:, 0] - margin, windows[:, 0], windows[:, 1])
+            seg_end = np.clip(spans[:, 1] + margin, seg_start, windows[:, 1])
+
+        rest_energy = []
+        for k, (s, e, a, b) in enumerate(zip(windows[:, 0], windows[:, 1], seg_start, seg_end), start=1):
+            seg = np.asarray(sig[a:b], dtype=self.dtype)
+            self._zf.writestr(f"{sid}/rep_{k:04d}.npy", _npy_bytes(seg))
+            total = float(np.sum(np.square(sig[s:e], dtype=float)))
+            kept = float(np.sum(np.square(sig[a:b], dtype=float)))
+            rest_energy.append(1.0 - kept / total if total > 0 else 0.0)
+        self._zf.writestr(f"{sid}/env.npy", _npy_bytes(env_out))
+
+        meta = {
+            "version": ARCHIVE_VERSION,
+            "id": sid,
+            "label": None if label is None else float(label),
+            "name": name,
+            "fs": fs,
+            "n_samples": int(n),
+            "env_fs": env_rate / step,
+            "env_q": int(round(fs / (env_rate / step))),
+            "window": self.window,
+            "activity_ratio": self.activity_ratio,
+            "margin": margin,
+            "dtype": self.dtype.name,
+            "reps": {
+                "start": windows[:, 0].tolist(),
+                "end": windows[:, 1].tolist(),
+                "peak_idx": windows[:, 2].tolist(),
+                "peak_time": np.asarray(peak_time, dtype=float).tolist(),
+                "env_peak": np.asarray(env_peak, dtype=float).tolist(),
+                "seg_start": seg_start.tolist(),
+                "seg_end": seg_end.tolist(),
+                "rest_energy": rest_energy,
+            },
+        }
+        self._zf.writestr(f"{sid}/meta.json", json.dumps(meta))
+
+
+class _ArchivedSignal:
+    """Stand-in for processed['notch'] that serves slices from the archived rep segments.
+
+    Samples outside the archived segments (rests dropped in "active" mode) read as
+    zeros; segments are read from the archive on first use.
+    """
+
+    def __init__(self, archive, session_id, meta):
+        self._archive = archive
+        self._sid = session_id
+        self._seg_start = np.asarray(meta["reps"]["seg_start"], dtype=np.int64)
+        self._seg_end = np.asarray(meta["reps"]["seg_end"], dtype=np.int64)
+        self._n = meta["n_samples"]
+        self._segments = {}
+
+    def __len__(self):
+        return self._n
+
+    def _segment(self, k):
+        seg = self._segments.get(k)
+        if seg is None:
+            seg = self._segments[k] = self._archive.read_rep(self._sid, k + 1)
+        return seg
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("Archived signals only support contiguous slices")
+        start, stop, _ = key.indices(self._n)
+        stop = max(start, stop)
+        k = int(np.searchsorted(self._seg_end, start, side="right"))
+        if k < len(self._seg_start) and self._seg_start[k] <= start and stop <= self._seg_end[k]:
+            return self._segment(k)[start - self._seg_start[k]:stop - self._seg_start[k]]
+        out = np.zeros(stop - start)
+        while k < len(self._seg_start) and self._seg_start[k] < stop:
+            lo, hi = max(start, self._seg_start[k]), min(stop, self._seg_end[k])
+            if hi > lo:
+                out[lo - start:hi - start] = self._segment(k)[lo - self._seg_start[k]:hi - self._seg_start[k]]
+            k += 1
+        return out
+
+
+class RepArchive:
+    """Random-access reader for archives written by RepArchiveWriter.
+
+    Features are recomputed through the feature registry from the archived
+    segments alone: rep, start, end, peak_idx, peak_time and env_peak come from
+    the metadata, everything else (rms, mdf, baseline/dynamic features, new
+    registry features working on rep segments) is computed on the stored signal
+    over the exact rep windows. For "full" archives this matches create_master_df.
+    For "active" archives the dropped rest samples count as zeros: rms is
+    corrected with the stored rest_energy, mdf and other signal features are
+    approximate (see RepArchiveWriter).
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._zf = zipfile.ZipFile(self.path, "r")
+        self._meta = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zf.close()
+
+    @property
+    def sessions(self):
+        return [name[:-len("/meta.json")] for name in self._zf.namelist() if name.endswith("/meta.json")]
+
+    def meta(self, session_id) -> dict:
+        sid = str(session_id)
+        if sid not in self._meta:
+            self._meta[sid] = json.loads(self._zf.read(f"{sid}/meta.json"))
+        return self._meta[sid]
+
+    def n_reps(self, session_id) -> int:
+        return len(self.meta(session_id)["reps"]["start"])
+
+    def read_rep(self, session_id, rep: int) -> np.ndarray:
+        """Archived filtered samples of rep `rep` (1-based): meta['reps']['seg_start'] to ['seg_end']."""
+        with self._zf.open(f"{session_id}/rep_{int(rep):04d}.npy") as f:
+            return np.load(io.BytesIO(f.read()), allow_pickle=False).astype(float)
+
+    def read_envelope(self, session_id):
+        """(envelope, its rate)."""
+        with self._zf.open(f"{session_id}/env.npy") as f:
+            env = np.load(io.BytesIO(f.read()), allow_pickle=False).astype(float)
+        return env, self.meta(session_id)["env_fs"]
+
+    def processed_view(self, session_id) -> dict:
+        """process_emg-like dict backed by the archive ('notch' slices, reduced-rate envelope)."""
+        meta = self.meta(session_id)
+        env, env_fs = self.read_envelope(session_id)
+        return {"fs": meta["fs"], "notch": _ArchivedSignal(self, str(session_id), meta),
+                "env": None, "env_lr": env, "env_fs": env_fs, "env_q": meta["env_q"]}
+
+    def rep_table(self, session_id, feature_cols=None, mdf_method: str = "welch") -> RepTable:
+        """Per-rep features of one session (all registry features by default)."""
+        meta = self.meta(session_id)
+        reps = meta["reps"]
+        n = len(reps["start"])
+        cols = {
+            "rep": np.arange(1, n + 1),
+            "start": np.asarray(reps["start"], dtype=np.int64),
+            "end": np.asarray(reps["end"], dtype=np.int64),
+            "peak_idx": np.asarray(reps["peak_idx"], dtype=np.int64),
+            "peak_time": np.asarray(reps["peak_time"], dtype=float),
+            "env_peak": np.asarray(reps["env_peak"], dtype=float),
+        }
+        table = RepTable(cols, file_id=meta["id"], n=n)
+        if n == 0:
+            return table
+        processed = self.processed_view(session_id)
+        if meta["window"] == "active" and "rms" in feature_closure(feature_cols):
+            # the zeroed rests only remove rest energy: rms over the window = kept rms / sqrt(1 - rest_energy)
+            table.compute(["rms"], _processed=processed)
+            kept = 1.0 - np.asarray(reps["rest_energy"], dtype=float)
+            table["rms"] = np.where(kept > 0, table["rms"] / np.sqrt(np.where(kept > 0, kept, 1.0)), table["rms"])
+        return table.compute(feature_cols, _processed=processed, _mdf_method=mdf_method)
+
+    def to_master_df(self, feature_cols=None, mdf_method: str = "welch") -> pd.DataFrame:
+        """create_master_df's training table recomputed from the archive only (same column order).
+
+        Identical to create_master_df for "full" archives. For "active" ones rms is
+        exact but mdf and other spectral features are computed with the rests
+        zeroed, so they differ slightly from what inference computes; a warning
+        is issued.
+        """
+        active = [sid for sid in self.sessions if self.meta(sid)["window"] == "active"]
+        if active:
+            warnings.warn(f"{len(active)} session(s) were archived with window='active': mdf and other spectral "
+                          "features are approximate (rests read as zeros). Archive with window='full' to "
+                          "reproduce create_master_df exactly.", stacklevel=2)
+        frames = []
+        for sid in self.sessions:
+            label = self.meta(sid)["label"]
+            table = self.rep_table(sid, feature_cols=feature_cols, mdf_method=mdf_method)
+            if len(table) == 0 or label is None:
+                continue
+            cols = dict(table.cols)
+            ordered = {k: cols.pop(k) for k in FEATURE_ORDER[:9] if k in cols}
+            ordered["is_fatigued"] = (ordered["rep"] >= label).astype(int)
+            ordered["file_id"] = np.full(len(table), table.file_id, dtype=object)
+            ordered.update({k: cols.pop(k) for k in FEATURE_ORDER if k in cols})
+            ordered.update(cols)
+            frames.append(pd.DataFrame(ordered))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).replace([np.inf, -np.inf], np.nan).dropna()
+
+    def storage_summary(self) -> dict:
+        """Compressed archive size next to the archived, rep-window and total recording time."""
+        infos = self._zf.infolist()
+        archived_s = window_s = total_s = 0.0
+        for sid in self.sessions:
+            meta = self.meta(sid)
+            reps = meta["reps"]
+            archived_s += (sum(reps["seg_end"]) - sum(reps["seg_start"])) / meta["fs"]
+            window_s += (sum(reps["end"]) - sum(reps["start"])) / meta["fs"]
+            total_s += meta["n_samples"] / meta["fs"]
+        return {
+            "sessions": len(self.sessions),
+            "compressed_bytes": int(sum(i.compress_size for i in infos)),
+            "uncompressed_bytes": int(sum(i.file_size for i in infos)),
+            "archived_seconds": archived_s,
+            "window_seconds": window_s,
+            "recording_seconds": total_s,
+        }
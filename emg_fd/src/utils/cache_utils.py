@@ -0,0 +1,183 @@
+import hashlib
+import os
+import pickle
+import re
+import shutil
+from collections import OrderedDict
+from importlib import util as importlib_util
+
+import joblib
+import numpy as np
+
+# Modules whose source defines the cached artefacts; editing any of them changes
+# the code fingerprint and therefore invalidates every cached entry.
+CODE_MODULES = (
+    "emg_fd.src.utils.emg_processing_utils",
+    "emg_fd.src.utils.data_utils",
+    "emg_fd.src.utils.rep_table_utils",  # per-rep feature definitions behind cached tables/predictions
+    "emg_fd.src.utils.cache_utils",
+)
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def code_fingerprint(modules=CODE_MODULES) -> str:
+    """Hash of the source files of the processing code."""
+    h = _hasher()
+    for name in modules:
+        spec = importlib_util.find_spec(name)
+        if spec is None or spec.origin is None:
+            continue
+        with open(spec.origin, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def signal_fingerprint(signal_data: np.ndarray, fs: float | None = None) -> str:
+    """Content hash of the raw sample bytes (dtype and shape included) and sampling rate."""
+    arr = np.ascontiguousarray(signal_data)
+    h = _hasher()
+    h.update(str((arr.dtype.str, arr.shape, None if fs is None else float(fs))).encode())
+    h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def file_fingerprint(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """Content hash of a file on disk (cheaper than parsing it)."""
+    h = _hasher()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bundle_fingerprint(model_bundle: dict) -> str:
+    """Hash of a model bundle's current content.
+
+    Recomputed on every call (a pickle of the small bundle) so that edits to the
+    bundle, e.g. a new threshold, change the key; the bundle is not modified.
+    """
+    h = _hasher()
+    h.update(pickle.dumps(model_bundle, protocol=pickle.HIGHEST_PROTOCOL))
+    return h.hexdigest()
+
+
+def make_key(*parts) -> str:
+    """Stable key from fingerprints and (nested) parameter values."""
+    h = _hasher()
+    h.update(repr(parts).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Two-level (memory + optional disk) LRU cache for pipeline artefacts.
+
+    Entries are stored per artefact kind (e.g. "signal", "reps", "features",
+    "prediction") under content-derived keys. Disk entries live in a
+    sub-directory named after the code fingerprint, so changing the processing
+    code invalidates them. On start-up, stale fingerprint directories created by
+    ResultCache (32-hex name with a marker file) are removed; nothing else in
+    cache_dir is touched.
+    """
+
+    def __init__(self, cache_dir: str | None = None, max_items: int = 256,
+                 max_disk_bytes: int = 512 * 1024 * 1024):
+        self.max_items = int(max_items)
+        self.max_disk_bytes = int(max_disk_bytes)
+        self.version = code_fingerprint()
+        self._mem = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.cache_dir = None
+        if cache_dir is not None:
+            root = os.path.abspath(os.path.expanduser(cache_dir))
+            os.makedirs(root, exist_ok=True)
+            for name in os.listdir(root):
+                stale = os.path.join(root, name)
+                if (name != self.version and _FINGERPRINT_DIR.fullmatch(name)
+                        and os.path.isfile(os.path.join(stale, _CACHE_MARKER))):
+                    shutil.rmtree(stale, ignore_errors=True)
+            self.cache_dir = os.path.join(root, self.version)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            open(os.path.join(self.cache_dir, _CACHE_MARKER), "a").close()
+
+    def _path(self, kind: str, key: str):
+        return os.path.join(self.cache_dir, f"{kind}-{key}.joblib")
+
+    def get(self, kind: str, key: str, default=None):
+        mem_key = (kind, key)
+        if mem_key in self._mem:
+            self._mem.move_to_end(mem_key)
+            self.hits += 1
+            return self._mem[mem_key]
+
+        if self.cache_dir is not None:
+            path = self._path(kind, key)
+            if os.path.exists(path):
+                try:
+                    value = joblib.load(path)
+                except Exception:
+                    os.remove(path)
+                else:
+                    os.utime(path)  # refresh recency for disk LRU
+                    self._remember(mem_key, value)
+                    self.hits += 1
+                    return value
+
+        self.misses += 1
+        return default
+
+    def put(self, kind: str, key: str, value):
+        self._remember((kind, key), value)
+        if self.cache_dir is not None:
+            tmp = self._path(kind, key) + ".tmp"
+            joblib.dump(value, tmp, compress=3)
+            os.replace(tmp, self._path(kind, key))
+            self._evict_disk()
+        return value
+
+    def get_or_compute(self, kind: str, key: str, fn):
+        value = self.get(kind, key, default=_MISSING)
+        if value is _MISSING:
+            value = self.put(kind, key, fn())
+        return value
+
+    def invalidate(self, kind: str | None = None):
+        """Drop every entry (or every entry of one kind) from memory and disk."""
+        for mem_key in [k for k in self._mem if kind is None or k[0] == kind]:
+            del self._mem[mem_key]
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name != _CACHE_MARKER and (kind is None or name.startswith(f"{kind}-")):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def _remember(self, mem_key, value):
+        self._mem[mem_key] = value
+        self._mem.move_to_end(mem_key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name == _CACHE_MARKER:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+_MISSING = object()
+
+# Fingerprint sub-directories are only ever created (and removed) with this marker inside
+_CACHE_MARKER = ".emg_fd_cache"
+_FINGERPRINT_DIR = re.compile(r"[0-9a-f]{32}")
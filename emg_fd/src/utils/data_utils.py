@@ -1,3 +1,6 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from pyomeca import Analogs
 import matplotlib.pyplot as plt
 import numpy as np
@@ -5,7 +8,14 @@ import os
 import pandas as pd
 import joblib
 
-from emg_fd.src.utils.emg_processing_utils import compute_rep_features, extract_reps, process_emg, add_baseline_features
+from emg_fd.src.utils.emg_processing_utils import compute_rep_features, extract_reps, process_emg, add_baseline_features, \
+    resample_to_rate, filter_emg, envelope_at, _segmentation_envelope
+from emg_fd.src.utils.cache_utils import ResultCache, bundle_fingerprint, make_key, signal_fingerprint
+from emg_fd.src.utils.rep_table_utils import RepTable, compute_rep_table, ewm_smooth, predict_proba_matrix, \
+    feature_closure
+from emg_fd.src.utils.quality_utils import QualityConfig, assess_signal_quality
+from emg_fd.src.utils.drift_utils import DriftMonitor
+from emg_fd.src.utils.archive_utils import RepArchiveWriter
 
 
 def load_and_extract_emg_from_c3d(file_path: str, channel_label: str):
@@ -49,69 +59,148 @@ def load_and_extract_emg_from_c3d(file_path: str, channel_label: str):
         print(f"Error loading or processing C3D file {file_path}: {e}")
         return None, None, None
 
-def plot_emg_signals(folder_path, channel_to_extract):
+def plot_emg_signals(folder_path, channel_to_extract, prefetch: int = 2):
     data = []
-    for file in os.listdir(folder_path):
-        if file.endswith(".c3d"):
-          full_path = os.path.join(folder_path, file)
-          signal_data, fs, signal_label = load_and_extract_emg_from_c3d(full_path, channel_to_extract)
-
-
-          if signal_data is not None:
-              time = np.arange(len(signal_data)) / fs
-
-              plt.figure(figsize=(12, 6))
-              plt.plot(time, signal_data)
-              plt.title(f'Signal from {signal_label} in {file}')
-              plt.xlabel('Time (s)')
-              plt.ylabel('Amplitude')
-              plt.grid(True)
-              plt.show()
-              data.append({"signal_data":signal_data, "fs":fs, "name":str(file), "time":time})
-          else:
-              print(f"Could not plot signal for channel '{channel_to_extract}'.")
+    for record in iter_c3d_folder(folder_path, channel_to_extract, prefetch=prefetch):
+        signal_data, fs, file, time = record["signal_data"], record["fs"], record["name"], record["time"]
+
+        if signal_data is not None:
+            plt.figure(figsize=(12, 6))
+            plt.plot(time, signal_data)
+            plt.title(f'Signal from {channel_to_extract} in {file}')
+            plt.xlabel('Time (s)')
+            plt.ylabel('Amplitude')
+            plt.grid(True)
+            plt.show()
+            data.append({"signal_data":signal_data, "fs":fs, "name":str(file), "time":time})
+        else:
+            print(f"Could not plot signal for channel '{channel_to_extract}'.")
 
     return data
 
-def load_with_csv(folder_path, csv_file_path, channel_to_extract):
-    extracted_data_list = []
+def prefetch_map(fn, items, prefetch: int = 2, max_workers: int = 2, max_buffer_bytes: int | None = None):
+    """Yield fn(item) in order while the next `prefetch` items are loaded on a thread pool.
+
+    Loading stops running ahead once the estimated size of buffered results
+    (largest result seen so far times results in flight) exceeds max_buffer_bytes;
+    one item is always allowed in flight so iteration never stalls.
+    With prefetch=0 the items are loaded synchronously.
+    """
+    if prefetch <= 0:
+        for item in items:
+            yield fn(item)
+        return
+
+    items = iter(items)
+    pending = deque()
+    est_bytes = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def fill():
+            while len(pending) < prefetch + 1:
+                if pending and max_buffer_bytes is not None and est_bytes * (len(pending) + 1) > max_buffer_bytes:
+                    return
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                pending.append(pool.submit(fn, item))
+
+        fill()
+        while pending:
+            result = pending.popleft().result()
+            est_bytes = max(est_bytes, _record_nbytes(result))
+            fill()
+            yield result
+
+
+def _record_nbytes(record) -> int:
+    if not isinstance(record, dict):
+        return 0
+    return sum(v.nbytes for v in record.values() if isinstance(v, np.ndarray))
+
+
+def _read_label_table(csv_file_path):
     df_labels = pd.read_csv(csv_file_path, sep=';', index_col=False)
-    df_labels = df_labels.dropna(axis=1, how='all')
-    for index, row in df_labels.iterrows():
-        file_id = row['id']
-        file_label = row['label']
-        c3d_filename = file_id + ".c3d"
-        c3d_file_path = os.path.join(folder_path, c3d_filename)
+    return df_labels.dropna(axis=1, how='all')
 
-        signal_data, fs, signal_label = load_and_extract_emg_from_c3d(c3d_file_path, channel_to_extract)
 
-        if signal_data is not None:
-            time = np.arange(len(signal_data)) / fs
-
-            extracted_data_list.append({
-                "id": file_id,
-                "label": file_label,
-                "signal_data": signal_data,
-                "fs": fs,
-                "name": c3d_filename,
-                "time": time
-            })
-            print(f"Successfully associated data for ID: {file_id} with label: {file_label}")
-        else:
-            print(f"Skipping ID: {file_id}. Could not load/process C3D file or channel.")
-            extracted_data_list.append({
-                "id": file_id,
-                "label": file_label,
-                "signal_data": None,
-                "fs": None,
-                "name": c3d_filename,
-                "time": None
-            })
-
-    return extracted_data_list
-
-def create_master_df(data):
+def _load_labelled_session(folder_path, file_id, file_label, channel_to_extract,
+                           quality_cfg: QualityConfig | None = None):
+    c3d_filename = file_id + ".c3d"
+    c3d_file_path = os.path.join(folder_path, c3d_filename)
+
+    signal_data, fs, signal_label = load_and_extract_emg_from_c3d(c3d_file_path, channel_to_extract)
+
+    record = {
+        "id": file_id,
+        "label": file_label,
+        "signal_data": None,
+        "fs": None,
+        "name": c3d_filename,
+        "time": None,
+        "channel": channel_to_extract,
+        "quality": None
+    }
+
+    if signal_data is None:
+        print(f"Skipping ID: {file_id}. Could not load/process C3D file or channel.")
+        return record
+
+    if quality_cfg is not None:
+        record["quality"] = assess_signal_quality(signal_data, fs, quality_cfg, channel_label=channel_to_extract)
+        if not record["quality"]["passed"]:
+            print(f"Rejecting ID: {file_id} ({channel_to_extract}) on quality gate: "
+                  f"{', '.join(record['quality']['reasons'])}")
+            return record
+
+    print(f"Successfully associated data for ID: {file_id} with label: {file_label}")
+    record.update(signal_data=signal_data, fs=fs, time=np.arange(len(signal_data)) / fs)
+    return record
+
+
+def iter_sessions(folder_path, csv_file_path, channel_to_extract, quality_cfg: QualityConfig | None = None,
+                  prefetch: int = 2, max_workers: int = 2, max_buffer_bytes: int | None = None):
+    """Lazily yield the same session records as load_with_csv, prefetching C3D files in the background.
+
+    The generator can be passed straight to create_master_df so C3D parsing of the
+    next sessions overlaps with filtering/feature extraction of the current one.
+    """
+    df_labels = _read_label_table(csv_file_path)
+    rows = zip(df_labels['id'], df_labels['label'])
+    return prefetch_map(
+        lambda row: _load_labelled_session(folder_path, row[0], row[1], channel_to_extract, quality_cfg),
+        rows, prefetch=prefetch, max_workers=max_workers, max_buffer_bytes=max_buffer_bytes,
+    )
+
+
+def iter_c3d_folder(folder_path, channel_to_extract, prefetch: int = 2, max_workers: int = 2,
+                    max_buffer_bytes: int | None = None):
+    """Yield {id, label, signal_data, fs, name, time, channel} records for every .c3d file in a folder (label is None)."""
+    files = sorted(f for f in os.listdir(folder_path) if f.endswith(".c3d"))
+
+    def _load(file):
+        signal_data, fs, _ = load_and_extract_emg_from_c3d(os.path.join(folder_path, file), channel_to_extract)
+        time = None if signal_data is None else np.arange(len(signal_data)) / fs
+        return {"id": os.path.splitext(file)[0], "label": None, "signal_data": signal_data,
+                "fs": fs, "name": file, "time": time, "channel": channel_to_extract}
+
+    return prefetch_map(_load, files, prefetch=prefetch, max_workers=max_workers,
+                        max_buffer_bytes=max_buffer_bytes)
+
+
+def load_with_csv(folder_path, csv_file_path, channel_to_extract, quality_cfg: QualityConfig | None = None,
+                  prefetch: int = 0):
+    return list(iter_sessions(folder_path, csv_file_path, channel_to_extract,
+                              quality_cfg=quality_cfg, prefetch=prefetch))
+
+def create_master_df(data, quality_cfg: QualityConfig | None = None,
+                     env_fs: float | None = None, canonical_fs: float | None = None, mdf_method: str = "welch",
+                     archive_path: str | None = None, archive_window: str = "active"):
     all_reps_data = []
+    # Rep segments + envelope + rep metadata, enough to recompute features without the C3D files
+    # ("full" keeps the exact rep windows, rests included, for bit-exact recomputation)
+    archive = RepArchiveWriter(archive_path, window=archive_window) if archive_path is not None else None
 
     print("Processing files to generate ML dataset...")
 
@@ -119,16 +208,32 @@ def create_master_df(data):
         if item['signal_data'] is None:
             continue
 
+        # Reuse the report from load_with_csv when present, otherwise gate here
+        quality = item.get('quality')
+        if quality is None and quality_cfg is not None:
+            quality = assess_signal_quality(item['signal_data'], item['fs'], quality_cfg,
+                                            channel_label=item.get('channel'))
+        if quality is not None and not quality['passed']:
+            print(f"Skipping ID: {item['id']} on quality gate: {', '.join(quality['reasons'])}")
+            continue
+
         failure_rep_threshold = item['label']
 
-        processed = process_emg(item['time'], item['signal_data'], fs=item['fs'])
+        signal_data, fs = resample_to_rate(item['signal_data'], item['fs'], canonical_fs)
+        time = item['time'] if fs == item['fs'] else np.arange(len(signal_data)) / fs
+
+        processed = process_emg(time, signal_data, fs=fs, env_fs=env_fs)
 
         peaks, rep_windows = extract_reps(processed, distance_seconds=2.0, prominence=0.2)
 
         # 3. Compute Features
-        df_features = compute_rep_features(rep_windows, processed, item['time'])
+        df_features = compute_rep_features(rep_windows, processed, time, mdf_method=mdf_method)
         df_features["rep_duration"] = df_features["end"] - df_features["start"]
 
+        if archive is not None:
+            archive.add_session(item["id"], processed, rep_windows, time=time, label=failure_rep_threshold,
+                                name=item.get("name"), env_peak=df_features["env_peak"].to_numpy())
+
         # --- Labeling Logic ---
         df_features['is_fatigued'] = df_features['rep'].apply(lambda x: 1 if x >= failure_rep_threshold else 0)
 
@@ -138,6 +243,9 @@ def create_master_df(data):
 
         all_reps_data.append(df_features)
 
+    if archive is not None:
+        archive.close()
+
     master_df = pd.concat(all_reps_data, ignore_index=True)
 
     master_df = master_df.replace([np.inf, -np.inf], np.nan).dropna()
@@ -163,22 +271,6 @@ def _safe_extract_reps(processed, time=None, distance_seconds=2.0, prominence=0.
         return extract_reps(time, processed, distance_seconds=distance_seconds, prominence=prominence)
 
 
-def _align_features_for_model(df_feat: pd.DataFrame, feature_cols):
-    """Ensure inference features match training columns exactly."""
-    X = df_feat.copy()
-    # Keep numeric columns only
-    X = X.select_dtypes(include=[np.number])
-
-    # Add any missing columns
-    for c in feature_cols:
-        if c not in X.columns:
-            X[c] = 0.0
-
-    # Drop any extra columns
-    X = X[feature_cols]
-    return X
-
-
 def load_model_bundle(bundle_path: str = "./models/fatigue_model_bundle.joblib"):
     """Load a saved model bundle created by save_model_bundle()."""
     bundle = joblib.load(bundle_path)
@@ -187,7 +279,9 @@ def load_model_bundle(bundle_path: str = "./models/fatigue_model_bundle.joblib")
 
 def save_model_bundle(model, feature_cols, best_threshold: float,
                       bundle_path: str = "./models/fatigue_model_bundle.joblib",
-                      trigger_M: int = 2, trigger_N: int = 3, smooth_alpha: float | None = None):
+                      trigger_M: int = 2, trigger_N: int = 3, smooth_alpha: float | None = None,
+                      model_variant: str = "logreg", mdf_method: str = "welch",
+                      drift_reference: dict | None = None):
     """Save everything needed for inference in one file."""
     os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
     bundle = {
@@ -197,6 +291,9 @@ def save_model_bundle(model, feature_cols, best_threshold: float,
         "trigger_M": int(trigger_M),
         "trigger_N": int(trigger_N),
         "smooth_alpha": None if smooth_alpha is None else float(smooth_alpha),
+        "model_variant": model_variant,
+        "mdf_method": mdf_method,  # MDF estimator the training features were computed with
+        "drift_reference": drift_reference,  # training feature sketches for DriftMonitor
     }
     joblib.dump(bundle, bundle_path)
     return bundle_path
@@ -204,12 +301,10 @@ def save_model_bundle(model, feature_cols, best_threshold: float,
 
 def trigger_index_m_of_n(proba: np.ndarray, thr: float, M: int = 2, N: int = 3):
     """Return first rep index where >=M of the last N reps exceed thr."""
-    above = (proba >= thr).astype(int)
-    for i in range(len(above)):
-        win = above[max(0, i - N + 1): i + 1]
-        if win.sum() >= M:
-            return int(i)
-    return None
+    csum = np.cumsum(np.asarray(proba) >= thr)
+    in_window = csum - np.concatenate([np.zeros(N, dtype=csum.dtype), csum[:-N]])[:len(csum)]
+    hits = np.flatnonzero(in_window >= M)
+    return int(hits[0]) if len(hits) else None
 
 
 def predict_fatigue_on_emg(
@@ -219,6 +314,11 @@ def predict_fatigue_on_emg(
     file_id: str = "new",
     distance_seconds: float = 2.0,
     prominence: float = 0.2,
+    cache: ResultCache | None = None,
+    env_fs: float | None = None,
+    canonical_fs: float | None = None,
+    as_frame: bool = True,
+    drift_monitor: DriftMonitor | None = None,
 ):
     """Preprocess a new EMG signal, extract reps, compute features, and predict fatigue per rep.
 
@@ -228,71 +328,148 @@ def predict_fatigue_on_emg(
         model_bundle: dict from load_model_bundle/save_model_bundle
         file_id: id used for grouping/baseline features
         distance_seconds/prominence: rep peak detection params
+        cache: optional ResultCache; features and predictions are keyed by the
+            signal content hash, these params and the bundle fingerprint
+        env_fs: if set, compute the envelope and segment reps at this reduced rate
+        canonical_fs: if set, resample the input to this rate before processing
+        as_frame: return df_pred as a DataFrame (default) or as the underlying RepTable
+        drift_monitor: optional DriftMonitor updated with this session's rep features
+            (not on prediction-cache hits); periodic reports collect in drift_monitor.reports
 
     Returns:
-        df_pred: per-rep dataframe with probabilities and binary predictions
+        df_pred: per-rep dataframe (or RepTable) with probabilities and binary predictions
         trigger_rep: first rep (by df_pred['rep']) where trigger condition fires, else None
     """
-    model = model_bundle["model"]
-    feature_cols = model_bundle["feature_cols"]
-    thr = float(model_bundle.get("best_threshold", 0.5))
-    M = int(model_bundle.get("trigger_M", 2))
-    N = int(model_bundle.get("trigger_N", 3))
-    smooth_alpha = model_bundle.get("smooth_alpha", None)
+    # Only the dependency closure of the model's features is computed; fail fast on unknown ones
+    feature_cols = list(model_bundle["feature_cols"])
+    feature_closure(feature_cols)
+    mdf_method = model_bundle.get("mdf_method", "welch")
+
+    if cache is not None:
+        sig_fp = signal_fingerprint(signal_data, fs)
+        # segmentation does not depend on the model's features, so another bundle can reuse it
+        reps_key = make_key(sig_fp, distance_seconds, prominence, env_fs, canonical_fs)
+        feat_key = make_key(reps_key, tuple(feature_cols), mdf_method)
+        pred_key = make_key(feat_key, file_id, bundle_fingerprint(model_bundle))
+        hit = cache.get("prediction", pred_key)
+        if hit is not None:
+            table, trigger_rep = hit  # already seen, so not added to drift_monitor again
+            return (table.to_frame() if as_frame else table.copy()), trigger_rep
+
+        table = cache.get("features", feat_key)
+        if table is None:
+            table = _session_rep_table(signal_data, fs, distance_seconds, prominence,
+                                       env_fs=env_fs, canonical_fs=canonical_fs, feature_cols=feature_cols,
+                                       mdf_method=mdf_method, cache=cache, reps_key=reps_key)
+            cache.put("features", feat_key, table)
+    else:
+        table = _session_rep_table(signal_data, fs, distance_seconds, prominence,
+                                   env_fs=env_fs, canonical_fs=canonical_fs, feature_cols=feature_cols,
+                                   mdf_method=mdf_method)
 
-    time = np.arange(len(signal_data)) / fs
+    if len(table) == 0:
+        df_empty = pd.DataFrame(columns=["rep", "proba", "pred"])
+        return df_empty, None
 
-    processed = process_emg(time, signal_data, fs=fs)
+    table = table.copy()
+    table.file_id = file_id
+    trigger_rep = score_rep_table(table, model_bundle)
 
-    peaks, rep_windows = _safe_extract_reps(
-        processed,
-        time=time,
-        distance_seconds=distance_seconds,
-        prominence=prominence,
-    )
+    if cache is not None:
+        cache.put("prediction", pred_key, (table.copy(), trigger_rep))
+    if drift_monitor is not None:
+        drift_monitor.update(table)
+
+    return (table.to_frame() if as_frame else table), trigger_rep
+
+
+def _reps_artefact(processed, rep_windows, env_fs: float = 100.0) -> dict:
+    """Compact segmentation result for the cache: rep windows, env_peak and a ~env_fs envelope (float32)."""
+    env, rate, q = _segmentation_envelope(processed)
+    step = max(1, int(round(rate / env_fs)))  # envelope is low-passed at 5 Hz, plain slicing is safe
+    windows = np.asarray(rep_windows, dtype=np.int64).reshape(len(rep_windows), 3)
+    return {"rep_windows": windows,
+            "env_peak": np.array([envelope_at(processed, p) for p in windows[:, 2]], dtype=float),
+            "env_lr": np.asarray(env[::step], dtype=np.float32), "env_fs": rate / step, "env_q": q * step}
+
+
+def _session_rep_table(signal_data, fs, distance_seconds, prominence, env_fs=None, canonical_fs=None,
+                       feature_cols=None, mdf_method="welch", cache=None, reps_key=None) -> RepTable:
+    """Filtering, segmentation and per-rep (incl. baseline) features for one session.
+
+    Only feature_cols and their dependencies are computed (all features if None).
+
+    Returns an empty RepTable when no reps are found. With a cache, the segmentation
+    (rep windows, env_peak, reduced-rate envelope) is stored under ("reps", reps_key)
+    and reused on a later features miss, e.g. for a bundle with other features; then
+    only the filtering is redone.
+    """
+    signal_data, fs = resample_to_rate(signal_data, fs, canonical_fs)
+    time = np.arange(len(signal_data)) / fs
+
+    reps = cache.get("reps", reps_key) if cache is not None else None
+    if reps is None:
+        processed = process_emg(time, signal_data, fs=fs, env_fs=env_fs)
+        peaks, rep_windows = _safe_extract_reps(
+            processed,
+            time=time,
+            distance_seconds=distance_seconds,
+            prominence=prominence,
+        )
+        if cache is not None:
+            reps = _reps_artefact(processed, rep_windows)
+            cache.put("reps", reps_key, reps)
+    else:
+        _, notch = filter_emg(signal_data, fs)
+        processed = {"fs": fs, "notch": notch, "env": None, "env_lr": reps["env_lr"], "env_fs": reps["env_fs"],
+                     "env_q": reps["env_q"]}
+        rep_windows = reps["rep_windows"]
 
     if len(rep_windows) == 0:
-        df_empty = pd.DataFrame(columns=["rep", "proba", "pred"])
-        return df_empty, None
+        return RepTable({})
 
-    df_feat = compute_rep_features(rep_windows, processed, time)
-    df_feat["file_id"] = file_id
+    table = RepTable({}, n=len(rep_windows))
+    if reps is not None and "env_peak" in feature_closure(feature_cols):
+        table["env_peak"] = reps["env_peak"]  # exact value, the cached envelope is decimated
+    # Baseline-normalized features use the first reps inside this new file
+    return table.compute(feature_cols, _windows=rep_windows, _processed=processed, _time=time,
+                         _mdf_method=mdf_method)
 
-    # Optional: keep rep_duration if it varies; if constant it will be harmless but not useful.
-    if "end" in df_feat.columns and "start" in df_feat.columns:
-        df_feat["rep_duration"] = df_feat["end"] - df_feat["start"]
 
-    # Add baseline-normalized features (uses first reps inside this new file)
-    df_feat = (
-        df_feat
-        .groupby("file_id", group_keys=False)[df_feat.columns]
-        .apply(add_baseline_features)
-    )
+def score_rep_table(table: RepTable, model_bundle: dict):
+    """Run the bundle's model and trigger rule on a RepTable (adds proba/proba_used/pred columns).
+
+    Returns:
+        trigger_rep: first rep where the M-of-N trigger fires, else None
+    """
+    feature_cols = model_bundle["feature_cols"]
 
-    # Align features exactly like training
-    X_new = _align_features_for_model(df_feat, feature_cols)
+    # Feature matrix laid out exactly like training
+    X_new = table.matrix(feature_cols)
 
-    proba = model.predict_proba(X_new)[:, 1]
+    proba = predict_proba_matrix(model_bundle["model"], X_new, feature_cols)
+    return apply_rep_proba(table, proba, model_bundle)
+
+
+def apply_rep_proba(table: RepTable, proba: np.ndarray, model_bundle: dict):
+    """Smoothing, thresholding and M-of-N trigger for already computed per-rep probabilities."""
+    thr = float(model_bundle.get("best_threshold", 0.5))
+    M = int(model_bundle.get("trigger_M", 2))
+    N = int(model_bundle.get("trigger_N", 3))
+    smooth_alpha = model_bundle.get("smooth_alpha", None)
 
     # Optional smoothing before triggering/prediction
     if smooth_alpha is not None:
-        s = pd.Series(proba)
-        proba_used = s.ewm(alpha=float(smooth_alpha), adjust=False).mean().to_numpy()
+        proba_used = ewm_smooth(proba, float(smooth_alpha))
     else:
         proba_used = proba
 
-    pred = (proba_used >= thr).astype(int)
-
-    df_pred = df_feat.copy()
-    df_pred["proba"] = proba
-    df_pred["proba_used"] = proba_used
-    df_pred["pred"] = pred
+    table["proba"] = proba
+    table["proba_used"] = proba_used
+    table["pred"] = (proba_used >= thr).astype(int)
 
-    # Trigger rep index (0-based index in df_pred order)
+    # Trigger rep index (0-based index in table order)
     trig_idx = trigger_index_m_of_n(proba_used, thr=thr, M=M, N=N)
     if trig_idx is None:
-        trigger_rep = None
-    else:
-        trigger_rep = int(df_pred.iloc[trig_idx]["rep"]) if "rep" in df_pred.columns else int(trig_idx)
-
-    return df_pred, trigger_rep
+        return None
+    return int(table["rep"][trig_idx])
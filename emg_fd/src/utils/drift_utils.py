@@ -0,0 +1,174 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Rep bookkeeping columns; their distribution says nothing about the signal
+DRIFT_EXCLUDE = ("rep", "start", "end", "peak_idx", "peak_time")
+
+
+def _finite(values) -> np.ndarray:
+    v = np.asarray(values, dtype=float).ravel()
+    return v[np.isfinite(v)]
+
+
+class FeatureSketch:
+    """Constant-size summary of one feature's distribution.
+
+    Counts on fixed bin edges (taken from training quantiles) plus count, mean and
+    M2 for the variance. Memory is O(n_bins) however many values are added, and
+    sketches on the same edges can be compared bin by bin.
+    """
+
+    __slots__ = ("edges", "counts", "n", "mean", "m2")
+
+    def __init__(self, edges, counts=None, n: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64) if counts is None \
+            else np.asarray(counts, dtype=np.int64)
+        self.n = int(n)
+        self.mean = float(mean)
+        self.m2 = float(m2)
+
+    @classmethod
+    def from_values(cls, values, n_bins: int = 10):
+        """Sketch with edges at the interior n_bins-quantiles of `values` (equal-mass reference bins)."""
+        v = _finite(values)
+        edges = np.unique(np.quantile(v, np.linspace(0, 1, n_bins + 1)[1:-1])) if len(v) else np.empty(0)
+        sketch = cls(edges)
+        sketch.update(v)
+        return sketch
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(d["edges"], d["counts"], d["n"], d["mean"], d["m2"])
+
+    def to_dict(self) -> dict:
+        return {"edges": self.edges.copy(), "counts": self.counts.copy(), "n": self.n, "mean": self.mean,
+                "m2": self.m2}
+
+    def empty_like(self):
+        return FeatureSketch(self.edges)
+
+    def update(self, values):
+        """Add a batch of values (non-finite ones are ignored)."""
+        v = _finite(values)
+        if len(v) == 0:
+            return
+        self.counts += np.bincount(np.searchsorted(self.edges, v, side="right"), minlength=len(self.counts))
+        # merge batch mean/M2 into the running ones (Chan et al.)
+        n_b = len(v)
+        mean_b = float(v.mean())
+        m2_b = float(np.sum((v - mean_b) ** 2))
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta ** 2 * self.n * n_b / n
+        self.n = n
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else float("nan")
+
+    def proportions(self, eps: float = 1e-4) -> np.ndarray:
+        p = self.counts / max(self.n, 1)
+        return np.clip(p, eps, None)
+
+
+def psi(reference: FeatureSketch, live: FeatureSketch, eps: float = 1e-4) -> float:
+    """Population stability index over the reference bins (>0.25 is usually read as a real shift)."""
+    p = reference.proportions(eps)
+    q = live.proportions(eps)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks_binned(reference: FeatureSketch, live: FeatureSketch) -> float:
+    """Kolmogorov-Smirnov distance evaluated at the bin edges (a lower bound on the exact statistic)."""
+    p = np.cumsum(reference.counts) / max(reference.n, 1)
+    q = np.cumsum(live.counts) / max(live.n, 1)
+    return float(np.max(np.abs(p - q)))
+
+
+def build_reference_sketches(X: pd.DataFrame, features=None, n_bins: int = 10) -> dict:
+    """Reference sketches of the training features, stored in the bundle as 'drift_reference'.
+
+    Returns:
+        dict feature name -> FeatureSketch.to_dict() (plain arrays and numbers)
+    """
+    if features is None:
+        features = [c for c in X.columns if c not in DRIFT_EXCLUDE]
+    return {name: FeatureSketch.from_values(X[name], n_bins=n_bins).to_dict() for name in features}
+
+
+class DriftMonitor:
+    """Compares the features of incoming sessions with the bundle's training reference.
+
+    update() adds one session's per-rep features (a RepTable or DataFrame) to live
+    sketches on the reference bins, so memory stays constant. Every report_every
+    sessions a drift report is produced (and by default a new window started): it
+    is returned by that update() call, appended to `reports` (last max_reports
+    kept) and passed to on_report if given. report() can be called at any time.
+    """
+
+    def __init__(self, reference: dict, report_every: int = 50, psi_threshold: float = 0.25,
+                 ks_threshold: float = 0.2, reset_after_report: bool = True, max_reports: int = 100,
+                 on_report=None):
+        self.reference = {name: FeatureSketch.from_dict(d) for name, d in reference.items()}
+        self.report_every = report_every
+        self.psi_threshold = psi_threshold
+        self.ks_threshold = ks_threshold
+        self.reset_after_report = reset_after_report
+        self.reports = deque(maxlen=max_reports)
+        self.on_report = on_report
+        self.reset()
+
+    @classmethod
+    def from_bundle(cls, model_bundle: dict, **kwargs):
+        reference = model_bundle.get("drift_reference")
+        if reference is None:
+            raise ValueError("Model bundle has no drift reference; retrain it with train_final_model")
+        return cls(reference, **kwargs)
+
+    def reset(self):
+        """Start a new monitoring window."""
+        self.live = {name: ref.empty_like() for name, ref in self.reference.items()}
+        self.n_sessions = 0
+
+    def update(self, table):
+        """Add one session; returns a report DataFrame when a reporting period completes, else None."""
+        for name, sketch in self.live.items():
+            if name in table:
+                sketch.update(table[name])
+        self.n_sessions += 1
+        if self.report_every and self.n_sessions % self.report_every == 0:
+            report = self.report()
+            if self.reset_after_report:
+                self.reset()
+            self.reports.append(report)
+            if self.on_report is not None:
+                self.on_report(report)
+            return report
+        return None
+
+    def report(self) -> pd.DataFrame:
+        """Per-feature PSI and binned KS of the current window against the reference."""
+        rows = []
+        for name, ref in self.reference.items():
+            live = self.live[name]
+            scored = live.n > 0 and ref.n > 0
+            row = {
+                "feature": name,
+                "n_ref": ref.n,
+                "n_live": live.n,
+                "psi": psi(ref, live) if scored else np.nan,
+                "ks": ks_binned(ref, live) if scored else np.nan,
+                "mean_ref": ref.mean,
+                "mean_live": live.mean if live.n else np.nan,
+                "std_ref": ref.std,
+                "std_live": live.std,
+            }
+            row["drifted"] = bool(scored and (row["psi"] >= self.psi_threshold or row["ks"] >= self.ks_threshold))
+            rows.append(row)
+        out = pd.DataFrame(rows)
+        out.attrs["n_sessions"] = self.n_sessions
+        return out
@@ -1,7 +1,9 @@
 import numpy as np
 from matplotlib import pyplot as plt
 import pandas as pd
-from scipy.signal import butter, filtfilt, iirnotch, welch, find_peaks
+from fractions import Fraction
+from scipy.fft import rfft, rfftfreq, next_fast_len
+from scipy.signal import butter, filtfilt, iirnotch, welch, find_peaks, resample_poly
 
 
 def butter_bandpass(lowcut, highcut, fs, order=4):
@@ -25,6 +27,35 @@ def rectify_and_envelope(emg, fs, lp_cut=5.0):
     env = filtfilt(b, a, rect)
     return rect, env
 
+def decimated_envelope(rect, fs, env_fs=100.0, lp_cut=5.0):
+    # Polyphase decimation (anti-aliasing FIR) of the rectified signal, then the
+    # envelope low-pass at the reduced rate. Sample k corresponds to full-rate index k*q.
+    q = max(1, int(round(fs / env_fs)))
+    rate = fs / q
+    dec = resample_poly(rect, 1, q) if q > 1 else rect
+    b, a = butter(4, lp_cut / (0.5 * rate), btype='low')
+    env = filtfilt(b, a, dec)
+    return env, rate, q
+
+def resample_to_rate(emg, fs, target_fs):
+    """Polyphase resampling of a recording to a canonical sampling rate."""
+    if target_fs is None or np.isclose(fs, target_fs):
+        return np.asarray(emg), fs
+    ratio = Fraction(float(target_fs) / float(fs)).limit_denominator(1000)
+    out = resample_poly(emg, ratio.numerator, ratio.denominator)
+    return out, fs * ratio.numerator / ratio.denominator
+
+def _segmentation_envelope(processed):
+    """(envelope, its rate, decimation factor) used for peak picking."""
+    if processed.get('env_lr') is not None:
+        return processed['env_lr'], processed['env_fs'], processed['env_q']
+    return processed['env'], processed['fs'], 1
+
+def envelope_at(processed, idx):
+    """Envelope value at full-rate sample index idx (works for both envelope modes)."""
+    env, _, q = _segmentation_envelope(processed)
+    return env[min(int(idx) // q, len(env) - 1)]
+
 def segment_reps_by_envelope(env, fs, distance_seconds=0.5, prominence=0.1):
     distance = int(distance_seconds * fs)
     peaks, props = find_peaks(env, distance=distance, prominence=prominence*np.max(env))
@@ -33,8 +64,10 @@ def segment_reps_by_envelope(env, fs, distance_seconds=0.5, prominence=0.1):
 def rms(signal_segment):
     return np.sqrt(np.mean(signal_segment**2))
 
-def median_frequency(signal_segment, fs):
-    f, Pxx = welch(signal_segment, fs=fs, nperseg=min(1024, len(signal_segment)))
+def welch_psd(signal_segment, fs):
+    return welch(signal_segment, fs=fs, nperseg=min(1024, len(signal_segment)))
+
+def median_from_psd(f, Pxx):
     cumsum = np.cumsum(Pxx)
     total = cumsum[-1]
     if total == 0:
@@ -42,38 +75,130 @@ def median_frequency(signal_segment, fs):
     median_idx = np.searchsorted(cumsum, total / 2.0)
     return f[median_idx]
 
-def process_emg(time, emg, fs=None, lowcut=20, highcut=450, notch_freq=50.0):
+def _interp_median_from_psd(f, Pxx):
+    """median_from_psd with linear interpolation inside the bin that crosses half the power."""
+    cumsum = np.cumsum(Pxx)
+    total = cumsum[-1]
+    if total <= 0:
+        return 0.0
+    i = int(np.searchsorted(cumsum, total / 2.0))
+    if i == 0:
+        return float(f[0])
+    return float(f[i - 1] + (total / 2.0 - cumsum[i - 1]) / (cumsum[i] - cumsum[i - 1]) * (f[i] - f[i - 1]))
+
+def periodogram_psd(signal_segment, fs):
+    # one Hann-windowed FFT over the whole rep, zero-padded to a fast length
+    x = np.asarray(signal_segment, dtype=float)
+    nfft = next_fast_len(len(x), real=True)
+    X = rfft((x - x.mean()) * np.hanning(len(x)), nfft)
+    return rfftfreq(nfft, 1.0 / fs), X.real ** 2 + X.imag ** 2
+
+# Spectral MDF modes: (PSD estimator, median rule); the other modes work on the time signal
+PSD_MDF_METHODS = {
+    "welch": (welch_psd, median_from_psd),
+    "periodogram": (periodogram_psd, _interp_median_from_psd),
+}
+
+def _mdf_welch(signal_segment, fs):
+    return median_from_psd(*welch_psd(signal_segment, fs))
+
+def _mdf_periodogram(signal_segment, fs):
+    return _interp_median_from_psd(*periodogram_psd(signal_segment, fs))
+
+def _mdf_autocorr(signal_segment, fs):
+    # second spectral moment from the lag-1 autocorrelation: E[(x[n]-x[n-1])^2] = 2(r0 - r1)
+    x = np.asarray(signal_segment, dtype=float)
+    x = x - x.mean()
+    r0 = np.dot(x, x)
+    if r0 <= 0:
+        return 0.0
+    rho1 = np.dot(x[1:], x[:-1]) / r0
+    return float(fs / np.pi * np.arcsin(np.sqrt(max(0.0, (1.0 - rho1) / 2.0))))
+
+def _mdf_zero_crossing(signal_segment, fs):
+    # mean rate of linearly interpolated zero crossings
+    x = np.asarray(signal_segment, dtype=float)
+    x = x - x.mean()
+    neg = np.signbit(x)
+    idx = np.flatnonzero(neg[1:] != neg[:-1])
+    if len(idx) < 2:
+        return 0.0
+    t = idx + x[idx] / (x[idx] - x[idx + 1])
+    return float((len(t) - 1) / (2.0 * (t[-1] - t[0])) * fs)
+
+MDF_METHODS = {
+    "welch": _mdf_welch,
+    "periodogram": _mdf_periodogram,
+    "autocorr": _mdf_autocorr,
+    "zero_crossing": _mdf_zero_crossing,
+}
+
+def median_frequency(signal_segment, fs, method="welch"):
+    """Median frequency of a rep segment.
+
+    method: 'welch' (reference), 'periodogram' (single zero-padded FFT, a few Hz
+    off Welch), or the much cheaper proxies 'autocorr' (spectral moment from the
+    lag-1 autocorrelation) and 'zero_crossing' (interpolated zero-crossing rate).
+    The proxies track MDF but read high on EMG spectra; the *_rel_base features
+    largely cancel that. validate_mdf_methods reports the error of each mode.
+    """
+    try:
+        estimator = MDF_METHODS[method]
+    except KeyError:
+        raise ValueError(f"Unknown MDF method '{method}' (known: {', '.join(MDF_METHODS)})") from None
+    return estimator(signal_segment, fs)
+
+def filter_emg(emg, fs, lowcut=20, highcut=450, notch_freq=50.0):
+    """Band-pass then notch filter: process_emg's ('bp', 'notch') signals."""
+    emg_bp = bandpass_filter(emg, lowcut, highcut, fs)
+    return emg_bp, notch_filter(emg_bp, fs, notch_freq=notch_freq)
+
+def process_emg(time, emg, fs=None, lowcut=20, highcut=450, notch_freq=50.0, env_fs=None):
+    """Filter a raw EMG signal and compute its envelope.
+
+    With env_fs set (e.g. 50-100 Hz) the envelope is only computed at that reduced
+    rate ('env_lr', with 'env_fs' and decimation factor 'env_q'; 'env' is None), and
+    rep segmentation runs there; spectral features still use the full-rate signal.
+    """
     if fs is None:
         dt = np.median(np.diff(time))
         fs = 1.0 / dt
     # print(f'Estimated sampling rate: {fs:.1f} Hz')
-    emg_bp = bandpass_filter(emg, lowcut, highcut, fs)
-    emg_notch = notch_filter(emg_bp, fs, notch_freq=notch_freq)
-    rect, env = rectify_and_envelope(emg_notch, fs, lp_cut=5.0)
-    return {'fs': fs, 'raw': emg, 'bp': emg_bp, 'notch': emg_notch, 'rect': rect, 'env': env}
+    emg_bp, emg_notch = filter_emg(emg, fs, lowcut=lowcut, highcut=highcut, notch_freq=notch_freq)
+    if env_fs is None:
+        rect, env = rectify_and_envelope(emg_notch, fs, lp_cut=5.0)
+        return {'fs': fs, 'raw': emg, 'bp': emg_bp, 'notch': emg_notch, 'rect': rect, 'env': env}
+
+    rect = np.abs(emg_notch)
+    env_lr, env_rate, q = decimated_envelope(rect, fs, env_fs=env_fs, lp_cut=5.0)
+    return {'fs': fs, 'raw': emg, 'bp': emg_bp, 'notch': emg_notch, 'rect': rect, 'env': None,
+            'env_lr': env_lr, 'env_fs': env_rate, 'env_q': q}
 
 def extract_reps_fixed_window(processed, distance_seconds=0.5, prominence=0.25):
     fs = processed['fs']
-    env = processed['env']
-    peaks, props = segment_reps_by_envelope(env, fs, distance_seconds=distance_seconds, prominence=prominence)
+    env, env_fs, q = _segmentation_envelope(processed)
+    n = len(processed['notch'])
+    peaks, props = segment_reps_by_envelope(env, env_fs, distance_seconds=distance_seconds, prominence=prominence)
+    peaks = np.minimum(peaks * q, n - 1)
     rep_windows = []
     for p in peaks:
         win_half = int(0.6 * fs)
         start = max(0, p - win_half)
-        end = min(len(env), p + win_half)
+        end = min(n, p + win_half)
         rep_windows.append((start, end, p))
     return peaks, rep_windows
 
 def extract_reps(processed, distance_seconds=0.5, prominence=0.25,
                  min_len_seconds=None, max_len_seconds=None):
     fs = processed["fs"]
-    env = processed["env"]
+    env, env_fs, q = _segmentation_envelope(processed)
+    n = len(processed["notch"])
 
-    peaks, props = segment_reps_by_envelope(env, fs,
+    peaks, props = segment_reps_by_envelope(env, env_fs,
                                            distance_seconds=distance_seconds,
                                            prominence=prominence)
-    peaks = np.asarray(peaks, dtype=int)
-    n = len(env)
+    # map (possibly decimated) peak indices back to full-rate samples
+    peaks = np.minimum(np.asarray(peaks, dtype=int) * q, n - 1)
 
     rep_windows = []
     if len(peaks) == 0:
@@ -116,46 +241,79 @@ def extract_reps(processed, distance_seconds=0.5, prominence=0.25,
 
     return peaks, rep_windows
 
-def compute_rep_features(rep_windows, processed, time):
+def compute_rep_features(rep_windows, processed, time, mdf_method="welch"):
     features = []
     fs = processed['fs']
     sig = processed['notch']
-    env = processed['env']
     for i, (start, end, p) in enumerate(rep_windows):
         seg = sig[start:end]
         rep_rms = rms(seg)
-        rep_mdf = median_frequency(seg, fs)
+        rep_mdf = median_frequency(seg, fs, method=mdf_method)
         peak_time = time[p]
         features.append({'rep': i+1, 'start': start, 'end': end, 'peak_idx': p, 'peak_time': peak_time,
-                         'rms': rep_rms, 'mdf': rep_mdf, 'env_peak': env[p]})
+                         'rms': rep_rms, 'mdf': rep_mdf, 'env_peak': envelope_at(processed, p)})
     return pd.DataFrame(features)
 
 def detect_optimal_rep(features, lookback=2):
-    df = features.copy().reset_index(drop=True)
+    df = features.reset_index(drop=True)
     if len(df) == 0:
         return None, 'no_reps'
-    rms_norm = (df['rms'] - df['rms'].min()) / (np.ptp(df['rms'].values) + 1e-8)
-    mdf_norm = (df['mdf'] - df['mdf'].min()) / (np.ptp(df['mdf'].values) + 1e-8)
-    score = rms_norm - mdf_norm[::-1].values
-    df['score'] = score
-    thr = 0.4 * np.nanmax(score)
-    candidates = df.index[df['score'] >= thr].tolist()
-    if not candidates:
-        idx = int(df['score'].idxmax())
-        return int(df.loc[idx, 'rep']), 'max_score'
-    earliest = [c for c in candidates if c >= lookback]
-    if earliest:
-        return int(df.loc[earliest[0], 'rep']), 'threshold_cross'
-    else:
-        return int(df.loc[candidates[0], 'rep']), 'threshold_cross_early'
+    (idx, method), = detect_optimal_rep_batch([df['rms'].to_numpy()], [df['mdf'].to_numpy()], lookback=lookback)
+    return int(df.loc[idx, 'rep']), method
 
-def plot_rep_trends(time, processed, features, optimal_rep=None, ground_truth_failure_rep=None, title=""):
-    fig, axs = plt.subplots(3, 1, figsize=(9, 8), sharex=True)
+def detect_optimal_rep_batch(rms_list, mdf_list, lookback=2):
+    """detect_optimal_rep for many sessions at once.
+
+    Sessions are padded into (n_sessions, max_reps) arrays and scored together.
+    Returns a list of (0-based rep index or None, method) per session.
+    """
+    n = len(rms_list)
+    lens = np.array([len(r) for r in rms_list], dtype=int)
+    out = [(None, 'no_reps')] * n
+    rows = np.flatnonzero(lens > 0)
+    if len(rows) == 0:
+        return out
+
+    L = int(lens.max())
+    R = np.full((len(rows), L), np.nan)
+    F = np.full((len(rows), L), np.nan)
+    for k, i in enumerate(rows):
+        R[k, :lens[i]] = rms_list[i]
+        F[k, :lens[i]] = mdf_list[i]
+    lens = lens[rows]
+    pos = np.arange(L)[None, :]
+    valid = pos < lens[:, None]
+
+    def _norm(x):
+        lo = np.nanmin(x, axis=1, keepdims=True)
+        return (x - lo) / (np.nanmax(x, axis=1, keepdims=True) - lo + 1e-8)
+
+    # MDF term is reversed within each session (as in the single-session heuristic)
+    rev = np.clip(lens[:, None] - 1 - pos, 0, None)
+    score = np.where(valid, _norm(R) - np.take_along_axis(_norm(F), rev, axis=1), np.nan)
+    thr = 0.4 * np.nanmax(score, axis=1)
+
+    cand = valid & (score >= thr[:, None])
+    late = cand & (pos >= lookback)
+    best = np.nanargmax(score, axis=1)
+    for k, i in enumerate(rows):
+        if late[k].any():
+            out[i] = (int(np.argmax(late[k])), 'threshold_cross')
+        elif cand[k].any():
+            out[i] = (int(np.argmax(cand[k])), 'threshold_cross_early')
+        else:
+            out[i] = (int(best[k]), 'max_score')
+    return out
+
+def _draw_rep_trends(fig, time, processed, features, optimal_rep=None, ground_truth_failure_rep=None, title=""):
+    axs = fig.subplots(3, 1, sharex=True)
     axs[0].plot(time, processed['raw'], label='raw', alpha=0.4)
     axs[0].plot(time, processed['bp'], label='bandpass')
     axs[0].set_ylabel('EMG (a.u.)')
     axs[0].legend(loc='upper right', fontsize='small')
-    axs[1].plot(time, processed['env'], label='envelope')
+    env, env_fs, _ = _segmentation_envelope(processed)
+    env_time = time if processed.get('env') is not None else np.arange(len(env)) / env_fs
+    axs[1].plot(env_time, env, label='envelope')
     axs[1].scatter([features.loc[i,'peak_time'] for i in range(len(features))],
                    features['env_peak'], marker='x', label='rep peaks')
     axs[1].set_ylabel('Envelope (a.u.)')
@@ -169,10 +327,21 @@ def plot_rep_trends(time, processed, features, optimal_rep=None, ground_truth_fa
         axs[2].axvline(optimal_rep-0.5, color='k', linestyle='--', label='optimal rep')
     if ground_truth_failure_rep is not None:
         axs[2].axvline(ground_truth_failure_rep-0.5, color='red', linestyle=':', label='Ground Truth Failure Rep')
-    plt.tight_layout()
-    plt.suptitle(title)
+    fig.tight_layout()
+    fig.suptitle(title)
+
+def plot_rep_trends(time, processed, features, optimal_rep=None, ground_truth_failure_rep=None, title=""):
+    fig = plt.figure(figsize=(9, 8))
+    _draw_rep_trends(fig, time, processed, features, optimal_rep, ground_truth_failure_rep, title)
     plt.show()
 
+def save_rep_trends(path, time, processed, features, optimal_rep=None, ground_truth_failure_rep=None, title=""):
+    """Render plot_rep_trends to an image file without pyplot (safe in worker threads/processes)."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(9, 8))
+    _draw_rep_trends(fig, time, processed, features, optimal_rep, ground_truth_failure_rep, title)
+    fig.savefig(path)
+
 def add_baseline_features(g):
     g = g.sort_values("rep").copy()
     base = g.head(3)[["rms", "mdf", "env_peak", "rep_duration"]].mean()
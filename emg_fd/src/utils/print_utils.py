@@ -38,3 +38,25 @@ def print_timing_summary(metrics: Dict):
     • early_rate = {metrics['early_rate']:.3f}, late_rate = {metrics['late_rate']:.3f}
       Rates of early vs. late triggers.
     """)
+
+def print_benchmark(table):
+    cols = ["variant", "n_features", "balanced_accuracy", "roc_auc", "per_rep_latency_us",
+            "per_session_latency_us", "model_kb", "load_ms"]
+    print("Model variants (OOF metrics vs. inference cost):")
+    print(table[cols].round(3).to_string(index=False))
+
+def print_mdf_validation(table):
+    cols = ["method", "us_per_rep", "speedup", "mae_hz", "p95_abs_err_hz", "bias_hz", "corr",
+            "mdf_rel_base_mae", "balanced_accuracy", "delta_balanced_accuracy"]
+    print("MDF estimator modes (error vs. Welch, effect on OOF balanced accuracy):")
+    print(table[cols].round(3).to_string(index=False))
+
+def print_latency_report(report: Dict):
+    print(f"""
+    • chunks = {report['n_chunks']} x {report['chunk_ms']:.0f} ms at {report['speed']}x speed
+    • processing per chunk: p50 = {report['proc_p50_ms']:.3f} ms, p99 = {report['proc_p99_ms']:.3f} ms, max = {report['proc_max_ms']:.3f} ms
+    • queueing: p99 wait = {report['wait_p99_ms']:.3f} ms, max queue depth = {report['queue_depth_max']}
+    • real-time factor = {report['real_time_factor']:.4f} (processing time / signal time)
+    • reps = {report['n_reps']}, onset rep = {report['onset_rep']}, trigger rep = {report['trigger_rep']}, delta = {report['delta_reps']}
+    • detection delay after onset rep end = {report['detection_delay_s']} s (wall: {report['detection_delay_wall_s']} s)
+    """)
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass
+from typing import Dict, List
+
+from scipy.signal import butter, sosfilt, sosfiltfilt, resample_poly, welch, find_peaks
+
+
+@dataclass
+class QualityConfig:
+    quality_fs: float = 500.0            # rate of the decimated view used for all checks
+    notch_freq: float = 50.0             # mains frequency (harmonics below Nyquist are included)
+    max_saturation_ratio: float = 0.01   # fraction of samples pinned at the rails
+    max_line_noise_ratio: float = 0.5    # mains band power / total EMG band power
+    min_snr_db: float = 6.0              # envelope active level vs. noise floor
+    min_activity_fraction: float = 0.02
+    max_activity_fraction: float = 0.98
+    min_reps: int = 1
+    distance_seconds: float = 2.0        # same peak params as create_master_df
+    prominence: float = 0.2
+
+
+def _decimated_view(signal_data: np.ndarray, fs: float, target_fs: float):
+    """Anti-aliased polyphase decimation to roughly target_fs (integer factor)."""
+    q = max(1, int(fs // target_fs))
+    if q == 1:
+        return signal_data, fs
+    return resample_poly(signal_data, 1, q), fs / q
+
+
+def saturation_ratio(signal_data: np.ndarray, step: int = 1, rel_tol: float = 1e-3) -> float:
+    """Fraction of (strided) samples sitting at the min/max rails of the recording."""
+    view = signal_data[::step]
+    lo, hi = float(np.min(view)), float(np.max(view))
+    span = hi - lo
+    if span == 0:
+        return 1.0
+    tol = rel_tol * span
+    pinned = (view <= lo + tol) | (view >= hi - tol)
+    return float(np.mean(pinned))
+
+
+def line_noise_ratio(signal_data: np.ndarray, fs: float, notch_freq: float = 50.0,
+                     band: tuple = (20.0, 450.0), half_width: float = 2.0) -> float:
+    """Power in the mains line (and harmonics) relative to the total power in the EMG band."""
+    f, Pxx = welch(signal_data, fs=fs, nperseg=min(1024, len(signal_data)))
+    hi = min(band[1], 0.5 * fs)
+    in_band = (f >= band[0]) & (f <= hi)
+    total = Pxx[in_band].sum()
+    if total == 0:
+        return 0.0
+
+    line = np.zeros_like(in_band)
+    harmonic = notch_freq
+    while harmonic <= hi:
+        line |= np.abs(f - harmonic) <= half_width
+        harmonic += notch_freq
+    return float(Pxx[in_band & line].sum() / total)
+
+
+def quick_envelope(signal_data: np.ndarray, fs: float, highpass: float = 20.0, lp_cut: float = 5.0):
+    """Cheap single-pass envelope: high-pass, rectify, zero-phase low-pass."""
+    sos_hp = butter(2, highpass / (0.5 * fs), btype="high", output="sos")
+    rect = np.abs(sosfilt(sos_hp, signal_data))
+    sos_lp = butter(2, lp_cut / (0.5 * fs), btype="low", output="sos")
+    return sosfiltfilt(sos_lp, rect)
+
+
+def envelope_snr_and_activity(env: np.ndarray, activity_level: float = 0.2):
+    """SNR (dB) of active level vs. noise floor and the fraction of time above the activity level."""
+    floor = float(np.percentile(env, 10))
+    active = float(np.percentile(env, 95))
+    if floor <= 0:
+        snr_db = np.inf if active > 0 else 0.0
+    else:
+        snr_db = float(20 * np.log10(active / floor))
+    thr = floor + activity_level * (active - floor)
+    activity = float(np.mean(env > thr)) if active > floor else 0.0
+    return snr_db, activity
+
+
+def assess_signal_quality(signal_data: np.ndarray, fs: float, cfg: QualityConfig | None = None,
+                          channel_label: str | None = None) -> Dict:
+    """Score a raw EMG recording on a decimated view and decide whether it is worth processing.
+
+    Returns a report dict with the individual metrics, ``passed`` and the list of
+    ``reasons`` the recording was rejected for (empty when it passed).
+    """
+    if cfg is None:
+        cfg = QualityConfig()
+
+    report = {
+        "channel": channel_label,
+        "n_samples": 0 if signal_data is None else int(len(signal_data)),
+        "saturation_ratio": np.nan,
+        "line_noise_ratio": np.nan,
+        "snr_db": np.nan,
+        "activity_fraction": np.nan,
+        "n_peaks": 0,
+        "passed": False,
+        "reasons": [],
+    }
+    reasons: List[str] = report["reasons"]
+
+    if signal_data is None or fs is None or len(signal_data) == 0:
+        reasons.append("no_data")
+        return report
+
+    signal_data = np.asarray(signal_data, dtype=float)
+    if not np.all(np.isfinite(signal_data)):
+        reasons.append("non_finite")
+        return report
+
+    if np.ptp(signal_data) == 0:
+        report["saturation_ratio"] = 1.0
+        reasons.append("flat_line")
+        return report
+
+    step = max(1, int(fs // cfg.quality_fs))
+    report["saturation_ratio"] = saturation_ratio(signal_data, step=step)
+
+    dec, dec_fs = _decimated_view(signal_data, fs, cfg.quality_fs)
+    report["line_noise_ratio"] = line_noise_ratio(dec, dec_fs, notch_freq=cfg.notch_freq)
+
+    env = quick_envelope(dec, dec_fs)
+    report["snr_db"], report["activity_fraction"] = envelope_snr_and_activity(env)
+
+    peaks, _ = find_peaks(env, distance=max(1, int(cfg.distance_seconds * dec_fs)),
+                          prominence=cfg.prominence * np.max(env))
+    report["n_peaks"] = int(len(peaks))
+
+    if report["saturation_ratio"] > cfg.max_saturation_ratio:
+        reasons.append("saturated")
+    if report["line_noise_ratio"] > cfg.max_line_noise_ratio:
+        reasons.append("line_noise")
+    if report["snr_db"] < cfg.min_snr_db:
+        reasons.append("low_snr")
+    if not (cfg.min_activity_fraction <= report["activity_fraction"] <= cfg.max_activity_fraction):
+        reasons.append("activity_out_of_range")
+    if report["n_peaks"] < cfg.min_reps:
+        reasons.append("no_reps")
+
+    report["passed"] = len(reasons) == 0
+    return report
+
+
+def assess_sessions_quality(data, cfg: QualityConfig | None = None,
+                            channel_label: str | None = None) -> pd.DataFrame:
+    """Quality report table for sessions returned by load_with_csv (one row per session)."""
+    rows = []
+    for item in data:
+        report = item.get("quality")
+        if report is None:
+            report = assess_signal_quality(item["signal_data"], item["fs"], cfg,
+                                           channel_label=channel_label if channel_label is not None
+                                           else item.get("channel"))
+        rows.append({"id": item.get("id"), **report, "reasons": ",".join(report["reasons"])})
+    return pd.DataFrame(rows)
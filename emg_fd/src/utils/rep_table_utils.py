@@ -0,0 +1,244 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple
+
+from emg_fd.src.utils.emg_processing_utils import rms, envelope_at, median_frequency, PSD_MDF_METHODS
+
+BASELINE_COLS = ["rms", "mdf", "env_peak", "rep_duration"]
+DYNAMIC_COLS = ["rms", "mdf", "env_peak"]
+
+# Inputs supplied by the caller rather than computed; intermediates are "_"-prefixed too
+# and never become table columns. "_mdf_method" is an optional option (default "welch").
+FEATURE_SOURCES = ("_windows", "_processed", "_time")
+
+
+@dataclass
+class FeatureSpec:
+    name: str
+    deps: Tuple[str, ...]
+    compute: Callable[[dict], object]
+
+
+FEATURE_REGISTRY: Dict[str, FeatureSpec] = {}
+
+
+def register_feature(name: str, deps, compute):
+    FEATURE_REGISTRY[name] = FeatureSpec(name, tuple(deps), compute)
+
+
+def _windows(ctx):
+    w = ctx["_windows"]
+    return np.asarray(w, dtype=np.int64).reshape(len(w), 3)
+
+def _roll3_mean(x):
+    csum = np.cumsum(x)
+    k = np.arange(1, len(x) + 1)
+    return (csum - np.concatenate([np.zeros(3), csum[:-3]])[:len(x)]) / np.minimum(k, 3)
+
+def _psd(ctx):
+    # PSDs only for the spectral MDF modes; None tells "mdf" to use its time-domain proxy
+    method = ctx.get("_mdf_method", "welch")
+    if method not in PSD_MDF_METHODS:
+        return None
+    psd_fn, _ = PSD_MDF_METHODS[method]
+    return [psd_fn(seg, ctx["_processed"]["fs"]) for seg in ctx["_segments"]]
+
+def _mdf(ctx):
+    method = ctx.get("_mdf_method", "welch")
+    if ctx["_psd"] is not None:
+        _, median_fn = PSD_MDF_METHODS[method]
+        return np.array([median_fn(f, P) for f, P in ctx["_psd"]], dtype=float)
+    fs = ctx["_processed"]["fs"]
+    return np.array([median_frequency(seg, fs, method) for seg in ctx["_segments"]], dtype=float)
+
+register_feature("rep", ["_windows"], lambda c: np.arange(1, len(c["_windows"]) + 1))
+register_feature("start", ["_windows"], lambda c: _windows(c)[:, 0])
+register_feature("end", ["_windows"], lambda c: _windows(c)[:, 1])
+register_feature("peak_idx", ["_windows"], lambda c: _windows(c)[:, 2])
+register_feature("peak_time", ["peak_idx", "_time"], lambda c: np.asarray(c["_time"])[c["peak_idx"]])
+register_feature("_segments", ["start", "end", "_processed"],
+                 lambda c: [c["_processed"]["notch"][s:e] for s, e in zip(c["start"], c["end"])])
+register_feature("rms", ["_segments"], lambda c: np.array([rms(seg) for seg in c["_segments"]], dtype=float))
+register_feature("_psd", ["_segments", "_processed"], _psd)
+register_feature("mdf", ["_psd", "_segments", "_processed"], _mdf)
+register_feature("env_peak", ["peak_idx", "_processed"],
+                 lambda c: np.array([envelope_at(c["_processed"], p) for p in c["peak_idx"]], dtype=float))
+register_feature("rep_duration", ["start", "end"], lambda c: c["end"] - c["start"])
+
+# Baseline-normalised and simple dynamic features (no future leakage), as in add_baseline_features
+for _col in BASELINE_COLS:
+    register_feature(f"{_col}_rel_base", [_col], lambda c, col=_col: c[col] / (c[col][:3].mean() + 1e-9))
+    register_feature(f"{_col}_delta_base", [_col], lambda c, col=_col: c[col] - c[col][:3].mean())
+for _col in DYNAMIC_COLS:
+    register_feature(f"{_col}_diff1", [_col], lambda c, col=_col: np.diff(c[col].astype(float), prepend=c[col][:1]))
+    register_feature(f"{_col}_roll3_mean", [_col], lambda c, col=_col: _roll3_mean(c[col].astype(float)))
+register_feature("peak_time_diff1", ["peak_time"], lambda c: np.diff(c["peak_time"], prepend=c["peak_time"][:1]))
+
+# Column order of compute_rep_features + add_baseline_features (file_id goes after env_peak)
+FEATURE_ORDER = [
+    "rep", "start", "end", "peak_idx", "peak_time", "rms", "mdf", "env_peak", "rep_duration",
+    *[f"{c}_{s}" for c in BASELINE_COLS for s in ("rel_base", "delta_base")],
+    *[f"{c}_{s}" for c in DYNAMIC_COLS for s in ("diff1", "roll3_mean")],
+    "peak_time_diff1",
+]
+ALL_FEATURES = [name for name in FEATURE_ORDER if name in FEATURE_REGISTRY]
+
+
+def feature_closure(names=None, available=()):
+    """Names needed to compute `names` (default: all features), dependencies first.
+
+    Raises ValueError for names the registry cannot produce.
+    """
+    if names is None:
+        names = ALL_FEATURES
+    unknown = [n for n in names if n not in FEATURE_REGISTRY and n not in available]
+    if unknown:
+        raise ValueError(f"Cannot compute feature(s) {unknown}: not in the feature registry "
+                         f"(known: {', '.join(ALL_FEATURES)})")
+
+    order, seen = [], set(available)
+
+    def visit(name):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in FEATURE_SOURCES:
+            order.append(name)
+            return
+        for dep in FEATURE_REGISTRY[name].deps:
+            visit(dep)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+class RepTable:
+    """Column-oriented per-rep feature table (dict of equal-length NumPy arrays).
+
+    Used on the inference path instead of a DataFrame; columns keep the names and
+    order of compute_rep_features + add_baseline_features, and to_frame()
+    produces the equivalent DataFrame at the API boundary. Columns are computed on
+    demand from FEATURE_REGISTRY, so only what a model needs is ever evaluated.
+    """
+
+    __slots__ = ("cols", "file_id", "n")
+
+    def __init__(self, cols: dict, file_id: str = "new", n: int | None = None):
+        self.cols = cols
+        self.file_id = file_id
+        self.n = n if n is not None else (len(next(iter(cols.values()))) if cols else 0)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, name):
+        return self.cols[name]
+
+    def __setitem__(self, name, values):
+        self.cols[name] = np.asarray(values)
+
+    def __contains__(self, name):
+        return name in self.cols
+
+    def copy(self):
+        return RepTable({k: v.copy() for k, v in self.cols.items()}, file_id=self.file_id, n=self.n)
+
+    @property
+    def columns(self):
+        return list(self.cols)
+
+    def compute(self, names=None, **sources):
+        """Add the columns `names` (default: all features) and whatever they depend on.
+
+        Columns already present are reused; missing inputs are taken from
+        `sources` (_windows, _processed, _time).
+        """
+        ctx = dict(sources)
+        ctx.update(self.cols)
+        for name in feature_closure(names, available=self.cols):
+            if name in ctx:
+                continue
+            if name in FEATURE_SOURCES:
+                raise ValueError(f"Feature input '{name}' is required but was not provided")
+            value = FEATURE_REGISTRY[name].compute(ctx)
+            ctx[name] = value
+            if not name.startswith("_"):
+                self.cols[name] = np.asarray(value)
+        return self
+
+    def matrix(self, feature_cols) -> np.ndarray:
+        """(n_reps, n_features) float matrix in feature_cols order."""
+        missing = [name for name in feature_cols if name not in self.cols]
+        if missing:
+            raise KeyError(f"Rep table is missing model feature(s) {missing}")
+        X = np.empty((len(self), len(feature_cols)), dtype=float)
+        for j, name in enumerate(feature_cols):
+            X[:, j] = self.cols[name]
+        return X
+
+    def to_frame(self) -> pd.DataFrame:
+        cols = dict(self.cols)
+        ordered = {k: cols.pop(k) for k in FEATURE_ORDER[:8] if k in cols}
+        ordered["file_id"] = np.full(len(self), self.file_id, dtype=object)
+        ordered.update({k: cols.pop(k) for k in FEATURE_ORDER if k in cols})
+        ordered.update(cols)
+        return pd.DataFrame(ordered)
+
+
+def compute_rep_table(rep_windows, processed, time, file_id: str = "new", feature_cols=None,
+                      mdf_method: str = "welch") -> RepTable:
+    """Array-backed counterpart of compute_rep_features + add_baseline_features.
+
+    With feature_cols (e.g. a bundle's feature list) only their dependency closure
+    is computed; e.g. the PSDs ("_psd", Welch or periodogram per mdf_method) are
+    skipped when no MDF feature is needed.
+    """
+    table = RepTable({}, file_id=file_id, n=len(rep_windows))
+    return table.compute(feature_cols, _windows=rep_windows, _processed=processed, _time=time,
+                         _mdf_method=mdf_method)
+
+
+def linear_scorer(model):
+    """Fold a [StandardScaler ->] binary LogisticRegression pipeline into (w, b), else None."""
+    steps = [s for _, s in model.steps] if isinstance(model, Pipeline) else [model]
+    clf = steps[-1]
+    if not isinstance(clf, LogisticRegression) or clf.coef_.shape[0] != 1:
+        return None
+    if len(steps) > 2 or (len(steps) == 2 and not isinstance(steps[0], StandardScaler)):
+        return None
+
+    w = clf.coef_[0].astype(float)
+    b = float(clf.intercept_[0])
+    if len(steps) == 2:
+        scaler = steps[0]
+        # transform() only applies what the scaler is configured for; mean_ is set even with with_mean=False
+        scale = scaler.scale_ if scaler.with_std else np.ones_like(w)
+        mean = scaler.mean_ if scaler.with_mean else np.zeros_like(w)
+        w = w / scale
+        b = b - float(np.dot(mean, w))
+    return w, b
+
+
+def predict_proba_matrix(model, X: np.ndarray, feature_cols) -> np.ndarray:
+    """P(fatigued) for a feature matrix; closed form for linear models, sklearn otherwise."""
+    lin = linear_scorer(model)
+    if lin is not None:
+        w, b = lin
+        return 1.0 / (1.0 + np.exp(-(X @ w + b)))
+    return model.predict_proba(pd.DataFrame(X, columns=list(feature_cols)))[:, 1]
+
+
+def ewm_smooth(x: np.ndarray, alpha: float) -> np.ndarray:
+    """pandas ewm(alpha, adjust=False).mean() as a first-order IIR filter."""
+    if len(x) == 0:
+        return x
+    y, _ = lfilter([alpha], [1.0, alpha - 1.0], x, zi=[(1.0 - alpha) * x[0]])
+    return y
@@ -0,0 +1,208 @@
+import numpy as np
+from scipy.signal import butter, iirnotch, tf2sos, sosfilt, group_delay, find_peaks
+
+from emg_fd.src.utils.data_utils import apply_rep_proba
+from emg_fd.src.utils.emg_processing_utils import rms, median_frequency
+from emg_fd.src.utils.rep_table_utils import RepTable, predict_proba_matrix, feature_closure
+
+
+class StreamingFatigueDetector:
+    """Incremental counterpart of predict_fatigue_on_emg for one live EMG stream.
+
+    Samples are pushed in chunks. Filtering is causal (sosfilt with carried state);
+    each filter is applied twice in cascade so the magnitude response, and with it
+    RMS/MDF, matches the zero-phase filtfilt used offline. The envelope low-pass
+    delay is compensated when mapping peaks back to samples, and peaks must stand
+    min_peak_ratio above the envelope floor so start-up noise is not taken as a rep
+    before the running envelope maximum is meaningful. Rep windows follow extract_reps: rep k ends halfway to
+    peak k+1, so a rep is finalised once the next peak is confirmed (or after
+    close_seconds of quiet, or on flush()). Only the filtered samples of the open
+    rep are buffered.
+
+    Scoring can be done here (push) or batched by the caller across streams:
+    push_samples() -> rep_table() -> predict -> apply_proba().
+    """
+
+    def __init__(self, model_bundle: dict, fs: float, distance_seconds: float = 2.0, prominence: float = 0.2,
+                 env_fs: float = 100.0, lowcut: float = 20, highcut: float = 450, notch_freq: float = 50.0,
+                 lp_cut: float = 5.0, close_seconds: float | None = None, min_peak_ratio: float = 2.0,
+                 file_id: str = "live"):
+        self.model_bundle = model_bundle
+        self.feature_cols = list(model_bundle["feature_cols"])
+        self._needed = set(feature_closure(self.feature_cols))
+        self.mdf_method = model_bundle.get("mdf_method", "welch")
+        self.fs = float(fs)
+        self.prominence = prominence
+        self.min_peak_ratio = min_peak_ratio
+        self.close_samples = None if close_seconds is None else int(close_seconds * self.fs)
+        self.file_id = file_id
+
+        nyq = 0.5 * self.fs
+        twice = lambda sos: np.vstack([sos, sos])
+        self._sos_bp = twice(butter(4, [lowcut / nyq, highcut / nyq], btype="band", output="sos"))
+        self._sos_notch = twice(tf2sos(*iirnotch(notch_freq, 30.0, self.fs)))
+        self._sos_lp = twice(butter(4, lp_cut / nyq, btype="low", output="sos"))
+        self._zi = [np.zeros((s.shape[0], 2)) for s in (self._sos_bp, self._sos_notch, self._sos_lp)]
+
+        self.q = max(1, int(round(self.fs / env_fs)))
+        self.env_fs = self.fs / self.q
+        self._distance_env = max(1, int(distance_seconds * self.env_fs))
+        # cascade delay = sum of per-section delays (the full high-order polynomial is ill-conditioned)
+        self._env_delay = int(round(sum(group_delay((sec[:3], sec[3:]), w=[0.5], fs=self.fs)[1][0]
+                                        for sec in self._sos_lp)))
+
+        self.n_samples = 0
+        self._env = np.empty(0)           # decimated causal envelope from _env_offset; index k <-> sample k*q
+        self._env_offset = 0
+        self._env_max = 0.0
+        self._env_floor = np.inf
+        self._warmup = int(1.0 * self.env_fs)  # filter settling time excluded from the floor
+        self._sig = np.empty(0)           # filtered samples from _sig_offset onward
+        self._sig_offset = 0
+        self._open_peak = None            # (full-rate peak index, envelope value) of the rep not yet finalised
+        self._last_env_peak = -1
+        self._rep_start = 0
+        self._rows = {k: [] for k in ("start", "end", "peak_idx", "peak_time", "rms", "mdf", "env_peak")}
+
+        self.table = None
+        self.trigger_rep = None
+        self.trigger_sample = None
+
+    @property
+    def n_reps(self) -> int:
+        return len(self._rows["start"])
+
+    def push_samples(self, chunk: np.ndarray) -> int:
+        """Filter a chunk, update rep segmentation; returns the number of newly finalised reps."""
+        chunk = np.asarray(chunk, dtype=float)
+        if len(chunk) == 0:
+            return 0
+        x, self._zi[0] = sosfilt(self._sos_bp, chunk, zi=self._zi[0])
+        x, self._zi[1] = sosfilt(self._sos_notch, x, zi=self._zi[1])
+        env, self._zi[2] = sosfilt(self._sos_lp, np.abs(x), zi=self._zi[2])
+
+        first = (-self.n_samples) % self.q
+        new_env = env[first::self.q]
+        if len(new_env):
+            self._env = np.concatenate([self._env, new_env])
+            self._env_max = max(self._env_max, float(new_env.max()))
+            settled = new_env[max(0, self._warmup - (self.n_samples + first) // self.q):]
+            if len(settled):
+                self._env_floor = min(self._env_floor, float(settled.min()))
+        self._sig = np.concatenate([self._sig, x])
+        self.n_samples += len(chunk)
+
+        before = self.n_reps
+        for p_env, env_peak in self._confirm_peaks():
+            p = max(0, p_env * self.q - self._env_delay)
+            if self._open_peak is not None:
+                prev_p, prev_env_peak = self._open_peak
+                self._finalise(prev_p, prev_env_peak, end=(prev_p + p) // 2)
+            self._open_peak = (p, env_peak)
+
+        if self._open_peak is not None and self.close_samples is not None:
+            p, env_peak = self._open_peak
+            if self.n_samples - p >= self.close_samples:
+                self._finalise(p, env_peak, end=p + self.close_samples)
+                self._open_peak = None
+        return self.n_reps - before
+
+    def flush(self) -> int:
+        """End of stream: finalise the open rep up to the last sample."""
+        if self._open_peak is None:
+            return 0
+        p, env_peak = self._open_peak
+        self._finalise(p, env_peak, end=self.n_samples)
+        self._open_peak = None
+        return 1
+
+    def _confirm_peaks(self):
+        # Peaks at least `distance` behind the newest envelope sample can no longer be
+        # displaced by a later, larger peak, so they are final.
+        lo = max(self._env_offset, self._last_env_peak)
+        seg = self._env[lo - self._env_offset:]
+        if len(seg) < 3 or self._env_max <= 0:
+            return []
+        peaks, _ = find_peaks(seg, distance=self._distance_env, prominence=self.prominence * self._env_max)
+        newest = self._env_offset + len(self._env) - 1
+        confirmed = []
+        for k in peaks + lo:
+            if k <= self._last_env_peak or k > newest - self._distance_env:
+                continue
+            if self._last_env_peak >= 0 and k - self._last_env_peak < self._distance_env:
+                continue
+            if not seg[k - lo] >= self.min_peak_ratio * self._env_floor:
+                continue
+            confirmed.append((int(k), float(seg[k - lo])))
+            self._last_env_peak = int(k)
+        if confirmed:
+            # the envelope before the newest peak is no longer searched or read
+            self._env = self._env[self._last_env_peak - self._env_offset:]
+            self._env_offset = self._last_env_peak
+        return confirmed
+
+    def _finalise(self, p, env_peak, end):
+        start = self._rep_start
+        end = int(min(max(end, p + 1), self.n_samples))
+        seg = self._sig[start - self._sig_offset:end - self._sig_offset]
+        rows = self._rows
+        rows["start"].append(start)
+        rows["end"].append(end)
+        rows["peak_idx"].append(p)
+        rows["peak_time"].append(p / self.fs)
+        # per-rep spectral/amplitude work only for features the model uses
+        if "rms" in self._needed:
+            rows["rms"].append(rms(seg))
+        if "mdf" in self._needed:
+            rows["mdf"].append(median_frequency(seg, self.fs, self.mdf_method))
+        rows["env_peak"].append(env_peak)
+
+        # everything before the next rep's start is no longer needed
+        self._sig = self._sig[end - self._sig_offset:]
+        self._sig_offset = end
+        self._rep_start = end
+
+    def rep_table(self) -> RepTable:
+        """Per-rep features (incl. baseline features) of all finalised reps."""
+        cols = {k: np.asarray(v) for k, v in self._rows.items() if len(v) == self.n_reps}
+        cols = {"rep": np.arange(1, self.n_reps + 1), **cols}
+        return RepTable(cols, file_id=self.file_id, n=self.n_reps).compute(self.feature_cols)
+
+    def apply_proba(self, table: RepTable, proba: np.ndarray):
+        """Apply externally computed probabilities; returns a trigger event the first time it fires."""
+        trigger_rep = apply_rep_proba(table, proba, self.model_bundle)
+        self.table = table
+        if trigger_rep is not None and self.trigger_rep is None:
+            self.trigger_rep = trigger_rep
+            self.trigger_sample = self.n_samples
+            return {"event": "trigger", "file_id": self.file_id, "rep": trigger_rep,
+                    "sample": self.n_samples, "time": self.n_samples / self.fs}
+        return None
+
+    def score(self):
+        """Score all finalised reps with the bundle; returns a trigger event or None."""
+        if self.n_reps == 0:
+            return None
+        table = self.rep_table()
+        proba = predict_proba_matrix(self.model_bundle["model"], table.matrix(self.feature_cols), self.feature_cols)
+        return self.apply_proba(table, proba)
+
+    def push(self, chunk: np.ndarray):
+        """push_samples + score; returns the list of events (rep completions and trigger)."""
+        n_new = self.push_samples(chunk)
+        return self._events(n_new)
+
+    def finish(self):
+        """flush + score; returns the remaining events."""
+        return self._events(self.flush())
+
+    def _events(self, n_new):
+        if n_new == 0:
+            return []
+        trigger = self.score()
+        events = [{"event": "rep", "file_id": self.file_id, "rep": int(r),
+                   "proba": float(self.table["proba_used"][r - 1]), "sample": self.n_samples}
+                  for r in range(self.n_reps - n_new + 1, self.n_reps + 1)]
+        if trigger is not None:
+            events.append(trigger)
+        return events